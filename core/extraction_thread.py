@@ -1,25 +1,35 @@
 """
 Extraction Worker - Background thread for processing files
 """
+import asyncio
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from PySide6.QtCore import QThread, Signal
-from typing import List, Dict, Any, Optional
-import json
+from typing import List, Dict, Any
 import os
-import re
 
 import core.llm_tools.schema_validation_tool
 from core.llm_tools.tools_manager import ToolsManager
-from core.llm_client import LLMClient, parse_code_fences
+from core.llm_client import LLMClient, parse_code_fences, new_async_http_client
 from core.file_manager import FileManager
-from core.llm_prompt import system_prompt, user_prompt
-from core.llm_tools.schema_validation_tool import validate_against_schema
+from core.llm_prompt import build_system_prompts, segment_position, user_prompt
+from core.llm_tools.schema_validation_tool import validate_against_schema, warm_validator_cache, MAX_REPORTED_ERRORS
 
 SCHEMA_TOOL_NAME = core.llm_tools.schema_validation_tool.TOOL_NAME
+# How many parsed files may wait for a free worker, bounds how far parsing runs ahead of the extraction
+PARSED_QUEUE_SIZE = 4
+_PARSE_DONE = object()  # sentinel, one per consumer
+PARSED_QUEUE_POLL_INTERVAL = 0.2  # seconds, how often blocked queue operations check for a stop
+LOG_FLUSH_INTERVAL = 0.1  # seconds
 
 class ExtractionThread(QThread):
     """Worker thread for extracting data from files"""
 
     progress = Signal(int, int)  # current, total
+    progress_pct = Signal(int)  # percentage of finished files, only emitted when it changes
     log = Signal(str)
     ext_finished = Signal()  # Extraction finished signal, must not be named "finished" (conflict with QThread builtin finished signal)
     error = Signal(str)
@@ -34,139 +44,334 @@ class ExtractionThread(QThread):
         self.method_config = method_config
         self.extraction_config = extraction_config
         self.file_manager = None
-        self.llm_client = None
-        self.tools_manager = None
+        self.schema_desc = None
+        self.system_messages = None
+        self.finished_count = 0
+        self.progress_pct_sent = 0
+        self.progress_lock = threading.Lock()
+        self.force_retry = self.schema_config['force_retry_on_validation_failure']
+        # Fail-retries per segment, a value the LLM can never get valid (e.g. a missing date) must not loop forever
+        self.max_force_retries = max(1, self.method_config.get('max_validation_retries', 1))
+        # Log lines are buffered and emitted in batches, every emit is a cross-thread Qt dispatch
+        self.log_buffer = deque()
+        self.log_flusher_stop = threading.Event()
+        if self.schema_config.get('json_schema'):
+            # Pre-warm the validator cache, it is reused by all files, segments and retries
+            warm_validator_cache(self.schema_config['json_schema'])
 
     def stop(self):
         """Stop the extraction process"""
         self.should_stop = True
 
+    def add_log(self, msg: str):
+        """Queue a log line, it is emitted with the next batch (thread-safe)"""
+        self.log_buffer.append(msg)
+
+    def flush_logs(self):
+        """Emit all queued log lines as one log message"""
+        lines = []
+        while self.log_buffer:
+            lines.append(self.log_buffer.popleft())
+        if lines:
+            self.log.emit("\n".join(lines))
+
+    def _log_flusher(self):
+        while not self.log_flusher_stop.wait(LOG_FLUSH_INTERVAL):
+            self.flush_logs()
+
     def run(self):
         """Run the extraction process"""
+        self.log_flusher_stop.clear()
+        log_flusher = threading.Thread(target=self._log_flusher, daemon=True)
+        log_flusher.start()
+        error = None
         try:
-            self.log.emit("Parsing Files...")
-            self.file_manager = FileManager(
-                file_list=self.extraction_config['files'],
-                output_path=self.extraction_config['output_folder'],
-                pdf_parse_mode=self.method_config['pdf_mode'],
-                use_segment=self.method_config['use_segmentation'],
-                max_seg_text_len=self.method_config['max_text_length'],
-                max_seg_page_cnt=self.method_config['max_pages_count'],
-                seg_overlap=self.method_config['overlapping_length'],
-            )
-
-            self.log.emit("Setting up LLM tools...")
-            # Pass schema for validation if enabled
-
-            schema_dict = self.schema_config['json_schema']
-
-            self.tools_manager = ToolsManager(
-                python_limit=self.method_config['max_python_call'],
-                web_fetch_limit=self.method_config['max_web_fetch_call'],
-                schema=schema_dict,
-                schema_validation_limit=self.method_config['max_validation_retries'],
-            )
-
-            self.log.emit("Initializing LLM client...")
-            self.llm_client = LLMClient(
-                endpoint=self.model_config['endpoint'],
-                model_name=self.model_config['model'],
-                headers=self.model_config['headers'],
-                tools_manager=self.tools_manager,
-                temperature=self.model_config['temperature'],
-                max_tokens=self.model_config['max_tokens'],
-                top_p=self.model_config['top_p'],
-                timeout=self.model_config['timeout'],
-            )
-
-            # Prepare schema information
-            schema_desc = self.prepare_schema_info()
-
-            # Initialize output directory for JSON files
-            self.log.emit(f"JSON output directory: {self.file_manager.output_path}")
-
-            # Process each file
-            total = self.file_manager.get_file_count()
-            for i, file_path in enumerate(self.file_manager.get_file_names()):
+            self.extract_all()
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.log_flusher_stop.set()
+            log_flusher.join()
+            self.flush_logs()  # emit the rest before signaling the end
+        if error is not None:
+            self.error.emit(error)
+        elif not self.should_stop:
+            self.ext_finished.emit()
+
+    def extract_all(self):
+        """Parse and extract all files"""
+        self.file_manager = FileManager(
+            file_list=self.extraction_config['files'],
+            output_path=self.extraction_config['output_folder'],
+            pdf_parse_mode=self.method_config['pdf_mode'],
+            use_segment=self.method_config['use_segmentation'],
+            max_seg_text_len=self.method_config['max_text_length'],
+            max_seg_page_cnt=self.method_config['max_pages_count'],
+            seg_overlap=self.method_config['overlapping_length'],
+            preload=False,
+            image_dpi=self.method_config.get('image_dpi', 300),
+            image_format=self.method_config.get('image_format', "jpg"),
+            text_only_dpi=self.method_config.get('text_only_dpi'),
+        )
+
+        # Prepare schema information, and the system messages shared by all segments
+        self.schema_desc = self.prepare_schema_info()
+        system_prompts = build_system_prompts(
+            json_schema_description=self.schema_desc,
+            tools_desc=self.method_config['tool_prompt'],
+            multiple_per_file=self.method_config['multi_obj'],
+        )
+        self.system_messages = {position: {"role": "system", "content": prompt}
+                                for position, prompt in system_prompts.items()}
+
+        # Initialize output directory for JSON files
+        self.add_log(f"JSON output directory: {self.file_manager.output_path}")
+
+        # Files are parsed by a producer thread while the workers extract the already parsed ones,
+        # so the LLM is not idle during parsing. The bounded queue stops parsing from running far ahead.
+        total = self.file_manager.get_file_count()
+        max_workers = max(1, self.method_config.get('max_concurrent_files', 8))
+        self.add_log(f"Parsing and processing {total} files with up to {max_workers} workers...")
+        self.finished_count = 0
+        self.progress_pct_sent = 0
+        parsed = queue.Queue(maxsize=PARSED_QUEUE_SIZE)
+        threading.Thread(target=self._parse_producer, args=(parsed, max_workers, total), daemon=True).start()
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            consumers = [ex.submit(self._extraction_consumer, parsed, total) for _ in range(max_workers)]
+            for consumer in consumers:
+                consumer.result()
+
+        if self.should_stop:
+            self.add_log("Extraction stopped by user.")
+
+    def _put_parsed(self, parsed: queue.Queue, item) -> bool:
+        """Put an item in the parsed queue unless the extraction is stopped, returns False if stopped"""
+        while True:
+            try:
+                parsed.put(item, timeout=PARSED_QUEUE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                # Stopped consumers no longer take items, never wait for them
                 if self.should_stop:
-                    self.log.emit("Extraction stopped by user.")
-                    return
+                    return False
 
-                self.log.emit(f"Processing: {os.path.basename(file_path)}")
-
-                self.llm_client.clear_history()  # clear tool use
-                last_resp = ""
-                segments = self.file_manager.get_segments(file_path)
-
-                try:
-                    for segment_id, segment_content in enumerate(segments):
-                        self.llm_client.messages = []     # clear messages but not tool use
-                        if self.method_config['use_segmentation']:
-                            segment_status = (segment_id+1, len(segments))
-                        else:
-                            segment_status = None
-                        self.llm_client.add_text_message(
-                            "system",
-                            system_prompt(json_schema_description=schema_desc,
-                                          tools_desc=self.method_config['tool_prompt'],
-                                          multiple_per_file=self.method_config['multi_obj'],
-                                          segment_status=segment_status)
-                        )
-                        self.llm_client.add_text_message(
-                            "user",
-                            user_prompt(content=segment_content['text'],
-                                        prev_history=last_resp,
-                                        segment_status=segment_status,
-                                        file_name=self.file_manager.strip_file_name(file_path))
-                        )
-                        for img in segment_content['img']:
-                            self.llm_client.add_image_message("user",
-                                                              img_b64=img)
-
-                        pass_schema_check = False
-
-                        while not pass_schema_check:
-                            pass_schema_check = True
-                            resp = self.llm_client.send_llm_request()
-                            last_resp = ""
-                            result = []
-                            objs = parse_code_fences(resp)
-                            for obj in objs:
-                                if '%missing%' in obj:
-                                    last_resp += f"```\n{obj}\n```\n"
-                                else:
-                                    if self.schema_config['force_retry_on_validation_failure']:
-                                        validation_result = validate_against_schema(schema=schema_dict, data_str=obj)
-                                        if validation_result['valid']:
-                                            result.append(obj)
-                                        else:
-                                            errors = '\n'.join(i['message'] for i in validation_result['errors'])
-                                            self.llm_client.add_text_message("user", f"Schema check failed for obj: \n```\n{obj}\n```\n, "
-                                                                                     f"Please fix the following errors: {errors}")
-                                            pass_schema_check = False
-                                    else:
-                                        result.append(obj)
-
-                        if self.extraction_config['log_raw']:
-                            self.file_manager.append_log_for_file(
-                                filename=file_path,
-                                log=self.llm_client.messages,
-                            )
-                        self.file_manager.append_result_for_file(
-                            filename=file_path,
-                            result=result,
-                        )
-                        self.log.emit(f"  > Extracted Parts {segment_id + 1} / {len(segments)}")
-
-                    self.log.emit(f"  > File Finished.")
-                except Exception as e:
-                    self.log.emit(f"Error processing {os.path.basename(file_path)}: {str(e)}")
+    def _parse_producer(self, parsed: queue.Queue, consumer_count: int, total: int):
+        """Parse the files (in parallel processes) and hand them to the consumers in order (runs in its own thread)"""
+        files = self.file_manager.iter_load_files()
+        try:
+            for file_path, error in files:
+                if self.should_stop:
+                    break
+                if error is not None:
+                    self.add_log(f"Error parsing {os.path.basename(file_path)}: {str(error)}")
+                    self._file_finished(total)  # nothing to extract, but it is done
                     continue
-                self.progress.emit(i + 1, total)
+                if not self._put_parsed(parsed, file_path):
+                    break
+        finally:
+            files.close()  # cancels the files still queued for parsing
+            for _ in range(consumer_count):
+                if not self._put_parsed(parsed, _PARSE_DONE):
+                    break
 
-            self.ext_finished.emit()
+    def _extraction_consumer(self, parsed: queue.Queue, total: int):
+        """Extract parsed files until the producer is done (runs in a worker thread)"""
+        while True:
+            try:
+                file_path = parsed.get(timeout=PARSED_QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if self.should_stop:
+                    return
+                continue
+            if file_path is _PARSE_DONE or self.should_stop:
+                return
+            self._process_file(file_path)
+            self._file_finished(total)
+
+    def _file_finished(self, total: int):
+        """Count a finished (extracted or failed) file and emit the progress"""
+        with self.progress_lock:
+            self.finished_count += 1
+            self.progress.emit(self.finished_count, total)
+            percentage = self.finished_count * 100 // total if total > 0 else 0
+            if percentage != self.progress_pct_sent:
+                self.progress_pct_sent = percentage
+                self.progress_pct.emit(percentage)
+
+    def create_tools_manager(self) -> ToolsManager:
+        """Create a ToolsManager, tool usage limits are tracked per instance"""
+        return ToolsManager(
+            python_limit=self.method_config['max_python_call'],
+            web_fetch_limit=self.method_config['max_web_fetch_call'],
+            schema=self.schema_config['json_schema'],
+            schema_validation_limit=self.method_config['max_validation_retries'],
+        )
+
+    def create_llm_client(self, tools_manager: ToolsManager) -> LLMClient:
+        """Create a LLMClient, message history is kept per instance"""
+        return LLMClient(
+            endpoint=self.model_config['endpoint'],
+            model_name=self.model_config['model'],
+            headers=self.model_config['headers'],
+            tools_manager=tools_manager,
+            temperature=self.model_config['temperature'],
+            max_tokens=self.model_config['max_tokens'],
+            top_p=self.model_config['top_p'],
+            timeout=self.model_config['timeout'],
+            retry_policy=self.model_config.get('retry_policy'),
+        )
+
+    def _process_file(self, file_path: str) -> None:
+        """Extract all segments of one file (runs in a worker thread)"""
+        if self.should_stop:
+            return
+        file_name = os.path.basename(file_path)
+        self.add_log(f"Processing: {file_name}")
+
+        # Clients carry message history, so never share them between workers or segments.
+        # Tool limits are per file, so the segments of one file share one ToolsManager.
+        tools_manager = self.create_tools_manager()
+        last_resp = ""
+
+        try:
+            segments = self.file_manager.get_segments(file_path)
+
+            # Speculatively extract all segments concurrently without previous partial objects.
+            # A speculative result is only used while the previous segment left nothing %missing%,
+            # otherwise that segment is requested again with the partial objects (paid twice).
+            # With one object per file the record is handed over between segments all the time, so this
+            # only runs with multiple objects per file, where records mostly fit in one segment.
+            # Speculative tool calls count against the file's tool budget like the serial ones.
+            speculative = []
+            max_concurrent_segments = self.method_config.get('max_concurrent_segments', 1)
+            if max_concurrent_segments > 1 and len(segments) > 1 and self.method_config['multi_obj']:
+                speculative = asyncio.run(self._extract_segments_concurrently(
+                    file_path, segments, tools_manager, max_concurrent_segments))
+
+            for segment_id, segment_content in enumerate(segments):
+                if self.should_stop:
+                    return
+                if segment_id < len(speculative) and not last_resp:
+                    result, last_resp, messages = speculative[segment_id]
+                else:
+                    llm_client = self.create_llm_client(tools_manager)
+                    self._add_segment_messages(llm_client, file_path, segment_id, segments, last_resp)
+                    for retry in range(self.max_force_retries + 1):
+                        resp = llm_client.send_llm_request()
+                        result, last_resp, pass_schema_check = self._check_segment_response(
+                            llm_client, resp, last_attempt=retry == self.max_force_retries)
+                        if pass_schema_check:
+                            break
+                    else:
+                        self.add_log(f"  > {file_name}: Schema check still failing after "
+                                     f"{self.max_force_retries} retries, keeping the invalid objects")
+                    messages = llm_client.messages
+
+                if self.extraction_config['log_raw']:
+                    self.file_manager.append_log_for_file(
+                        filename=file_path,
+                        log=messages,
+                    )
+                self.file_manager.append_result_for_file(
+                    filename=file_path,
+                    result=result,
+                )
+                self.add_log(f"  > {file_name}: Extracted Parts {segment_id + 1} / {len(segments)}")
+
+            self.add_log(f"  > {file_name}: File Finished.")
         except Exception as e:
-            self.error.emit(str(e))
+            self.add_log(f"Error processing {file_name}: {str(e)}")
+        finally:
+            # Results are buffered per segment and written once per file, also keep what was done on errors
+            try:
+                self.file_manager.flush_results_for_file(file_path)
+            except Exception as e:
+                self.add_log(f"Error writing results of {file_name}: {str(e)}")
+            # The segments and page images are not needed anymore, do not hold them until the run ends
+            self.file_manager.release_file(file_path)
+
+    async def _extract_segments_concurrently(self, file_path, segments, tools_manager, max_concurrent):
+        """
+        Extract every segment with no previous partial objects, at most max_concurrent at a time.
+        The segments share tools_manager, its limits count the tool calls of all of them.
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def _process_segment(segment_id):
+            async with semaphore:
+                llm_client = self.create_llm_client(tools_manager)
+                llm_client.async_http_client = http_client
+                self._add_segment_messages(llm_client, file_path, segment_id, segments, prev_history="")
+                for retry in range(self.max_force_retries + 1):
+                    resp = await llm_client.send_llm_request_async()
+                    result, partial_objs, pass_schema_check = self._check_segment_response(
+                        llm_client, resp, last_attempt=retry == self.max_force_retries)
+                    if pass_schema_check:
+                        break
+                else:
+                    self.add_log(f"  > {os.path.basename(file_path)}: Schema check still failing after "
+                                 f"{self.max_force_retries} retries, keeping the invalid objects")
+                return result, partial_objs, llm_client.messages
+
+        # The segments of a file share one connection pool
+        async with new_async_http_client() as http_client:
+            return await asyncio.gather(*[_process_segment(i) for i in range(len(segments))])
+
+    def _add_segment_messages(self, llm_client: LLMClient, file_path: str,
+                              segment_id: int, segments: List[Dict], prev_history: str):
+        """Fill a fresh LLMClient with the prompts and images of one segment"""
+        segment_content = segments[segment_id]
+        if self.method_config['use_segmentation']:
+            segment_status = (segment_id+1, len(segments))
+        else:
+            segment_status = None
+        llm_client.add_shared_message(self.system_messages[segment_position(segment_status)])
+        llm_client.add_text_message(
+            "user",
+            user_prompt(content=segment_content['text'],
+                        prev_history=prev_history,
+                        segment_status=segment_status,
+                        file_name=self.file_manager.strip_file_name(file_path))
+        )
+        for img in segment_content['img']:
+            llm_client.add_image_message("user",
+                                         img_b64=img)
+
+    def _check_segment_response(self, llm_client: LLMClient, resp: str, last_attempt: bool = False):
+        """
+        Split a LLM response into complete and partial (%missing%) objects.
+        If schema check fails, the retry request is added to llm_client,
+        on the last attempt the invalid objects are kept in the result instead.
+        Returns (result, partial_objs, pass_schema_check)
+        """
+        objs = parse_code_fences(resp)
+        if not self.force_retry:
+            # Nothing is validated, so the response always passes
+            result = [obj for obj in objs if '%missing%' not in obj]
+            partial_objs = "".join(f"```\n{obj}\n```\n" for obj in objs if '%missing%' in obj)
+            return result, partial_objs, True
+
+        schema_dict = self.schema_config['json_schema']
+        pass_schema_check = True
+        partial_objs = ""
+        result = []
+        for obj in objs:
+            if '%missing%' in obj:
+                partial_objs += f"```\n{obj}\n```\n"
+                continue
+            validation_result = validate_against_schema(schema=schema_dict, data_str=obj,
+                                                        max_errors=MAX_REPORTED_ERRORS)
+            if validation_result['valid']:
+                result.append(obj)
+            elif last_attempt:
+                result.append(obj)
+                pass_schema_check = False
+            else:
+                errors = '\n'.join(i['message'] for i in validation_result['errors'])
+                llm_client.add_text_message("user", f"Schema check failed for obj: \n```\n{obj}\n```\n, "
+                                                    f"Please fix the following errors: {errors}")
+                pass_schema_check = False
+        return result, partial_objs, pass_schema_check
 
     def prepare_schema_info(self) -> str:
         """Prepare schema information for the LLM prompt"""
@@ -1,62 +1,257 @@
-import base64
-import json
+import atexit
+import functools
+import hashlib
+import io
+import multiprocessing
 import os.path
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import repeat
 from pathlib import Path
-from typing import List, Literal, Dict
+from typing import List, Literal, Dict, Optional
 import fitz
-import pypdf
-from pypdf.errors import PdfReadError
 import logging
-from core import img_uri
+from core import img_uri, json_utils
+
+try:
+    import pypdf  # optional, only the fallback of pdf_reader
+    from pypdf.errors import PdfReadError
+except ImportError:
+    pypdf = None
+
+try:
+    from PIL import Image  # only needed to render pages as webp
+except ImportError:
+    Image = None
+
+try:
+    # optional, libjpeg-turbo (SIMD) encodes rendered pages faster than the libjpeg bundled with MuPDF
+    import numpy as np
+    import turbojpeg
+except ImportError:
+    turbojpeg = None
+
+# Bump when the layout of parsed file entries changes, to invalidate old parse caches
+PARSE_CACHE_VERSION = 4
+# First line of every parse cache file, checked before anything is unpickled
+_PARSE_CACHE_HEADER = b"MAIDX parse cache %d\n" % PARSE_CACHE_VERSION
+# Keys of the (nested) entry values holding images, they are cached as (mime type, raw bytes)
+_IMAGE_KEYS = frozenset(("img", "paged_img", "pimg"))
+
+# Process pool of the CPU-bound parsing (page rendering, whole files), shared so the workers are only spawned once
+_process_pool = None
+_process_pool_size = 0
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _process_pool, _process_pool_size
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size != max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            # Spawn (instead of fork) as the caller is usually a multithreaded Qt process
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                               mp_context=multiprocessing.get_context("spawn"))
+            _process_pool_size = max_workers
+        return _process_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """Forget a broken pool, the next user gets a new one"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+@atexit.register
+def _shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Output files are written by a few threads, the GIL is released while waiting on the disk
+_output_writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="output-writer")
+
+
+def _write_output(output_file, content):
+    """Write a str (as utf-8 text) or bytes to a file"""
+    if isinstance(content, bytes):
+        with open(output_file, 'wb') as f:
+            f.write(content)
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def _file_identity(file_path):
+    """(mtime, size) of a file, so cached reads are invalidated by edits. None if it can not be stat'ed"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _ParseCacheUnpickler(pickle.Unpickler):
+    """Parse caches only hold builtin containers, strings and bytes, so every global is refused"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a parse cache")
+
+
+def _convert_images(value, convert, memo, is_image=False):
+    """
+    Copy of a parsed entry with convert applied to each of its images.
+    The segments share the image objects of the pages, memo (by id) keeps them shared in the copy.
+    """
+    if isinstance(value, dict):
+        return {k: _convert_images(v, convert, memo, k in _IMAGE_KEYS) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_convert_images(v, convert, memo, is_image) for v in value]
+    if not is_image or not value:  # not an image, or "" for unreadable images
+        return value
+    if id(value) not in memo:
+        memo[id(value)] = (value, convert(value))  # keep value referenced, so its id is not reused
+    return memo[id(value)][1]
+
+
+def _image_to_cache(img):
+    """Data URI -> (mime type, raw bytes), a third smaller than the base64 text"""
+    return img_uri.from_data_uri(img) if isinstance(img, str) and img_uri.is_data_uri(img) else img
+
+
+def _image_from_cache(img):
+    return img_uri.to_data_uri(*img) if isinstance(img, tuple) else img
+
+
+def _parse_file_worker(settings: Dict, file):
+    """
+    Parse one file in a worker process, see FileManager.iter_load_files.
+    Files already run in parallel, so pages are rendered inline instead of in a nested pool.
+    """
+    return FileManager([], preload=False, render_workers=1, **settings).parse_file(file)
 
 
 def read_txt(file_path):
+    identity = _file_identity(file_path)
+    if identity is None:
+        return ""
+    return _read_txt_cached(file_path, *identity)
+
+
+@functools.lru_cache(maxsize=64)
+def _read_txt_cached(file_path, mtime_ns, size):
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        data = Path(file_path).read_bytes()  # read once, a failed decode does not read the file again
     except Exception as e:
         return ""
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('utf-8', errors='replace')
+    # Same newlines as a file opened in text mode
+    return text.replace('\r\n', '\n').replace('\r', '\n') if '\r' in text else text
 
 
 def read_img(file_path):
+    identity = _file_identity(file_path)
+    if identity is None:
+        return ""
+    return _read_img_cached(file_path, *identity)
+
+
+@functools.lru_cache(maxsize=64)  # entries are whole base64 images
+def _read_img_cached(file_path, mtime_ns, size):
     try:
         mime_type = img_uri.convert_ext_to_mime(file_path)
         with open(file_path, 'rb') as f:
             img_content = f.read()
-        base64_encoded_image = base64.b64encode(img_content).decode()
-        return f"data:{mime_type};base64,{base64_encoded_image}"
+        return img_uri.to_data_uri(mime_type, img_content)
     except Exception as e:
         return ""
 
 
-def pdf_render_img(pdf_file_path, dpi: int = 300, output_format: Literal['jpg', 'png'] = "jpg"):
+@functools.lru_cache(maxsize=1)
+def _get_turbojpeg():
+    """TurboJPEG encoder of this process, None if PyTurboJPEG or the libturbojpeg library is missing"""
+    if turbojpeg is None:
+        return None
+    try:
+        return turbojpeg.TurboJPEG()
+    except Exception:  # OSError if the shared library is not found
+        return None
+
+
+def _render_one(pdf_file_path, page_num: int, dpi: int, output_format: str, text_only_dpi: int = None) -> str:
     """
-    Reads a PDF file, renders each page as an image, and returns a list
-    of images in base64 format.
+    Render one page of a PDF file as a base64 image data URI.
+    Top-level (picklable) so it can run in a worker process, every call opens its own document.
+    text_only_dpi: if set, used instead of dpi for pages without embedded images
     """
-    try:
-        doc = fitz.open(pdf_file_path)
+    with fitz.open(pdf_file_path) as doc:
+        page = doc.load_page(page_num)
+        if text_only_dpi and not page.get_images():
+            dpi = text_only_dpi
         # Calculate the scale factor for rendering based on DPI
         # PyMuPDF's default resolution is 72 DPI.
         zoom_factor = dpi / 72.0
-        mat = fitz.Matrix(zoom_factor, zoom_factor)  # Matrix(zoom-x, zoom-y) - zoom
-        base64_images = []
-        mime_type = img_uri.convert_ext_to_mime(output_format)
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(matrix=mat)
-
-            # Convert pixmap to bytes in the desired image format
-            img_bytes: bytes
-            if output_format.lower() == "jpg":
+        # Matrix(zoom-x, zoom-y) - zoom. Explicit RGB without alpha, what every output format expects,
+        # so MuPDF renders straight into the final colorspace and no alpha channel is allocated
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom_factor, zoom_factor), colorspace=fitz.csRGB, alpha=False)
+
+        # Convert pixmap to bytes in the desired image format
+        img_bytes: bytes
+        if output_format.lower() == "jpg":
+            jpeg = _get_turbojpeg()
+            if jpeg is not None and pix.n == 3 and pix.stride == pix.width * 3:
+                samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+                img_bytes = jpeg.encode(samples, quality=90, pixel_format=turbojpeg.TJPF_RGB)
+            else:
                 img_bytes = pix.tobytes(output="jpg", jpg_quality=90)
-            else:  # png
-                img_bytes = pix.tobytes(output="png")
-            base64_encoded_image = base64.b64encode(img_bytes).decode('utf-8')
-            base64_images.append(f"data:{mime_type};base64,{base64_encoded_image}")
-        doc.close()
-        return base64_images
+        elif output_format.lower() == "webp":
+            # About 30% smaller than jpg at the same quality, encoded by Pillow from the raw samples
+            if Image is None:
+                raise ValueError("Pillow is required to render pages as webp")
+            buf = io.BytesIO()
+            Image.frombytes("RGB", (pix.width, pix.height), pix.samples).save(buf, "WEBP", quality=80, method=4)
+            img_bytes = buf.getvalue()
+        else:  # png
+            img_bytes = pix.tobytes(output="png")
+    return img_uri.to_data_uri(img_uri.convert_ext_to_mime(output_format), img_bytes)
+
+
+def pdf_render_img(pdf_file_path, dpi: int = 300, output_format: Literal['jpg', 'png', 'webp'] = "jpg",
+                   max_workers: int = None, text_only_dpi: int = None):
+    """
+    Reads a PDF file, renders each page as an image, and returns a list
+    of images in base64 format.
+    Pages are rendered in parallel by a process pool (rasterizing and encoding are CPU-bound),
+    max_workers defaults to the CPU count. The pool stays alive for the next PDFs.
+    text_only_dpi: if set, pages without embedded images are rendered at this (usually lower) DPI
+    """
+    try:
+        with fitz.open(pdf_file_path) as doc:
+            n_pages = len(doc)
+
+        max_workers = max_workers or os.cpu_count() or 1
+        if min(max_workers, n_pages) <= 1:
+            return [_render_one(pdf_file_path, page_num, dpi, output_format, text_only_dpi)
+                    for page_num in range(n_pages)]
+
+        pool = _get_process_pool(max_workers)
+        try:
+            # map keeps the page order
+            return list(pool.map(_render_one, repeat(pdf_file_path), range(n_pages),
+                                 repeat(dpi), repeat(output_format), repeat(text_only_dpi)))
+        except BrokenProcessPool:
+            _discard_process_pool(pool)
+            raise
     except FileNotFoundError:
         logging.warning(f"Error: PDF file not found at '{pdf_file_path}'")
         return []
@@ -65,11 +260,94 @@ def pdf_render_img(pdf_file_path, dpi: int = 300, output_format: Literal['jpg',
         return []
 
 
-def pdf_reader(pdf_file_path):
+def pdf_reader(pdf_file_path, extract_images=True):
     """
     Reads a PDF file, extracts text content page by page, and converts embedded images
     into base64 encoded data URIs.
+    Text and images come from a single PyMuPDF pass over the document,
+    pypdf is only used as a fallback if PyMuPDF fails.
+    extract_images: set to False to skip the images (every page gets an empty list)
+    """
+    page_texts = []
+    page_images = []
+    uri_by_xref = {}  # an image shown on many pages (e.g. a logo) is one xref, encode it once
+    try:
+        with fitz.open(pdf_file_path) as doc:
+            for page_num, page in enumerate(doc):
+                page_texts.append(page.get_text("text") or "")
+
+                images = []
+                for img_info in (page.get_images(full=True) if extract_images else ()):
+                    xref = img_info[0]
+                    if xref in uri_by_xref:
+                        images.append(uri_by_xref[xref])
+                        continue
+                    try:
+                        extracted = doc.extract_image(xref)
+                        mime_type = img_uri.convert_ext_to_mime(extracted['ext'])
+                        uri_by_xref[xref] = img_uri.to_data_uri(mime_type, extracted['image'])
+                        images.append(uri_by_xref[xref])
+                    except Exception as e:
+                        logging.warning(f"Could not process image on page {page_num + 1} (xref {xref}): {e}")
+                        continue  # Skip to the next image
+
+                page_images.append(images)
+        return page_texts, page_images
+    except FileNotFoundError:
+        logging.warning(f"File {pdf_file_path} not found")
+        return [], []
+    except Exception as e:
+        logging.warning(f"PyMuPDF can not read {pdf_file_path} ({e}), falling back to pypdf.")
+        return _pypdf_reader(pdf_file_path, extract_images)
+
+
+def pdf_text(pdf_file_path, separator="\n\n") -> str:
+    """
+    Text of a whole PDF file, the pages joined by separator.
+    Each page is written into one buffer as soon as it is extracted, the per-page strings are never kept.
+    pypdf is only used as a fallback if PyMuPDF fails.
+    """
+    buf = io.StringIO()
+    try:
+        with fitz.open(pdf_file_path) as doc:
+            for page_num, page in enumerate(doc):
+                if page_num:
+                    buf.write(separator)
+                buf.write(page.get_text("text") or "")
+        return buf.getvalue()
+    except FileNotFoundError:
+        logging.warning(f"File {pdf_file_path} not found")
+        return ""
+    except Exception as e:
+        logging.warning(f"PyMuPDF can not read {pdf_file_path} ({e}), falling back to pypdf.")
+        return separator.join(_pypdf_reader(pdf_file_path, extract_images=False)[0])
+
+
+def pdf_parse(pdf_file_path, mode: Literal["text", "text_with_img", "page_as_img"] = "text",
+              dpi: int = 300, output_format: Literal['jpg', 'png', 'webp'] = "jpg", text_only_dpi: int = None,
+              render_workers: int = None):
+    """
+    Parse a PDF file according to the PDF parse mode.
+    Returns (page_texts, page_images), page_images is a list of image data URIs per page.
+    - text: text of each page, page images are empty (embedded images are skipped)
+    - text_with_img: text and embedded images of each page (one read of the document)
+    - page_as_img: each page rendered as one image, page texts are None
     """
+    if mode == "page_as_img":
+        pimg = pdf_render_img(pdf_file_path, dpi=dpi, output_format=output_format, text_only_dpi=text_only_dpi,
+                              max_workers=render_workers)
+        return [None] * len(pimg), [[i] for i in pimg]
+    # The text mode drops the images, so do not extract & encode them at all
+    return pdf_reader(pdf_file_path, extract_images=(mode != "text"))
+
+
+def _pypdf_reader(pdf_file_path, extract_images=True):
+    """
+    Fallback of pdf_reader based on pypdf, used if PyMuPDF can not read the file.
+    """
+    if pypdf is None:
+        logging.warning(f"PDF {pdf_file_path} not readable (install pypdf for a second try).")
+        return [], []
     page_texts = []
     page_images = []
     try:
@@ -85,14 +363,11 @@ def pdf_reader(pdf_file_path):
                 else:
                     page_texts.append("")
 
-                for img_ref in page.images:
+                for img_ref in (page.images if extract_images else ()):
                     try:
                         image_bytes = img_ref.data
                         mime_type = img_uri.convert_ext_to_mime(img_ref.name)
-                        base64_encoded_image = base64.b64encode(image_bytes).decode('utf-8')
-                        data_uri = f"data:{mime_type};base64,{base64_encoded_image}"
-                        images.append(data_uri)
-                        # print(f"Processing {img_ref.name}")
+                        images.append(img_uri.to_data_uri(mime_type, image_bytes))
                     except Exception as e:
                         logging.warning(f"Could not process image on page {page_num + 1} ({img_ref.name}): {e}")
                         continue  # Skip to the next image
@@ -110,12 +385,16 @@ def pdf_reader(pdf_file_path):
 class FileManager:
     def __init__(self, file_list: List[str], output_path: str = None,
                  pdf_parse_mode="text", use_segment=False,
-                 max_seg_text_len=0, max_seg_page_cnt=0, seg_overlap=0):
+                 max_seg_text_len=0, max_seg_page_cnt=0, seg_overlap=0, preload=True,
+                 image_dpi=300, image_format="jpg", text_only_dpi=None, render_workers=None):
         """
         File manager for LLM
         (Can operate without output path, but no output functions can be called)
         path_list: list of file paths
         pdf_parse_mode: decide how to parse PDF files. "text", "text_with_img", "page_as_img"
+        preload: parse all files now; otherwise call load_file for each file before using it
+        image_dpi, image_format, text_only_dpi: how pages are rendered in "page_as_img" mode, see pdf_render_img
+        render_workers: processes rendering the pages of one PDF, defaults to the CPU count
         """
         pdf_parse_mode: Literal["text", "text_with_img", "page_as_img"]
         self.path_list = file_list
@@ -127,9 +406,14 @@ class FileManager:
         self.max_seg_text_len = max_seg_text_len
         self.max_seg_page_cnt = max_seg_page_cnt
         self.seg_overlap = seg_overlap
+        self.image_dpi = image_dpi
+        self.image_format = image_format
+        self.text_only_dpi = text_only_dpi
+        self.render_workers = render_workers
 
         self.files = {}
-        self.load_files()
+        if preload:
+            self.load_files()
         """
         files: {
             "X:/xxx.pdf": {
@@ -140,9 +424,9 @@ class FileManager:
                 # below optional attributes
                 "result": [parsed_json1, parsed_json2, ...]
                 
-                "text": "all_my_texts"
+                "text": "all_my_texts" (txt, text mode pdf; without segmentation this is the segment text object, not a copy)
                 "img": "page1_img1_base64"
-                "paged_text": ["page1", "page2", "page3"]
+                "paged_text": ["page1", "page2", "page3"] (text_with_img pdf)
                 "paged_img": [[page1_img1_base64, p1_img2, ...], [page2_img_1_base64], ..],
                 "mode": "text_with_img", (pdf)
             },
@@ -153,7 +437,7 @@ class FileManager:
         return self.files.keys()
 
     def get_file_count(self):
-        return len(self.files)
+        return len(self.path_list)
 
     def get_segments(self, filename) -> Dict:
         return self.files[filename]['segments']
@@ -163,43 +447,71 @@ class FileManager:
         return Path(s).name
 
     def append_result_for_file(self, filename: str, result: List[str]):
+        """Buffer results of a file, they are written by flush_results_for_file"""
         if filename not in self.files:
             raise ValueError(f"File {filename} not found.")
         if 'result' not in self.files[filename]:
             self.files[filename]['result'] = []
-        base_id = len(self.files[filename]['result'])
         self.files[filename]['result'].extend(result)
-        for cnt, content in enumerate(result):
-            output_file = Path(self.output_path) / f"{self.strip_file_name(filename)}" \
-                                                   f"_output_{base_id + cnt + 1}.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(content)
 
     def append_log_for_file(self, filename: str, log):
+        """Buffer a log of a file, it is written by flush_results_for_file"""
         if filename not in self.files:
             raise ValueError(f"File {filename} not found.")
-        if 'log_id' not in self.files[filename]:
-            self.files[filename]['log_id'] = 0
-        self.files[filename]['log_id'] += 1
-        log_id = self.files[filename]['log_id']
-        output_file = Path(self.output_path) / f"{self.strip_file_name(filename)}" \
-                                               f"_log_{log_id}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(json.dumps(log, ensure_ascii=False, indent=2))
+        if 'pending_log' not in self.files[filename]:
+            self.files[filename]['pending_log'] = []
+        self.files[filename]['pending_log'].append(log)
+
+    def flush_results_for_file(self, filename: str):
+        """Write the buffered results and logs of a file, each to its own JSON file"""
+        if filename not in self.files:
+            raise ValueError(f"File {filename} not found.")
+        file_info = self.files[filename]
+        writes = []
+        results = file_info.get('result', [])
+        base_id = file_info.get('result_written', 0)
+        for cnt, content in enumerate(results[base_id:]):
+            output_file = Path(self.output_path) / f"{self.strip_file_name(filename)}" \
+                                                   f"_output_{base_id + cnt + 1}.json"
+            writes.append(_output_writer.submit(_write_output, output_file, content))
+        file_info['result_written'] = len(results)
+
+        log_id = file_info.get('log_id', 0)
+        for log in file_info.pop('pending_log', []):
+            log_id += 1
+            output_file = Path(self.output_path) / f"{self.strip_file_name(filename)}" \
+                                                   f"_log_{log_id}.json"
+            writes.append(_output_writer.submit(_write_output, output_file, json_utils.dumps(log, indent=True)))
+        file_info['log_id'] = log_id
+
+        for write in writes:
+            write.result()  # wait for all, raises the write errors
+
+    def release_file(self, filename: str):
+        """Drop the parsed content (segments, text, images) of a processed file, the result counters are kept"""
+        file_info = self.files.get(filename)
+        if file_info is None:
+            return
+        for key in ("segments", "text", "img", "paged_text", "paged_img", "pimg"):
+            file_info.pop(key, None)
 
     @staticmethod
     def segment_text(s, max_len, overlap):
+        return [s[start: start + max_len] for start in FileManager.segment_starts(len(s), max_len, overlap)]
+
+    @staticmethod
+    def segment_starts(length, max_len, overlap):
+        """
+        Start offsets of the segments of a sequence, each segment is max_len long (the last one may be shorter)
+        and overlaps the previous one by overlap. The last segment is the first to reach the end.
+        """
         if max_len <= overlap:
             raise ValueError("Segment max_len <= overlap")
-        result = []
-        cur_pos = 0
-        while cur_pos < len(s):
-            seg_end = min(cur_pos + max_len, len(s))
-            result.append(s[cur_pos: seg_end])
-            if seg_end == len(s):
-                break
-            cur_pos += max_len - overlap
-        return result
+        if length <= 0:
+            return range(0)
+        # A segment starting at i is not the last one while i + max_len < length,
+        # so the next start (i + max_len - overlap) is below length - overlap
+        return range(0, max(length - overlap, 1), max_len - overlap)
 
     @staticmethod
     def merge_pages_into_one_segment(pages):
@@ -219,93 +531,201 @@ class FileManager:
 
     @staticmethod
     def segment_pages(page_list, max_len, overlap):
-        if max_len <= overlap:
-            raise ValueError("Segment max_len <= overlap")
-        segments = []
-        cur_pos = 0
-        n_pages = len(page_list)
-        while cur_pos < n_pages:
-            segment_end = min(cur_pos + max_len, n_pages)
-            segments.append(page_list[cur_pos: segment_end])
-            if segment_end == n_pages:
-                break
-            cur_pos += max_len - overlap
-        result = []
-        for cid, pages in enumerate(segments):
-            result.append(FileManager.merge_pages_into_one_segment(pages))
-        return result
-
-    def load_files(self):
-        for file in self.path_list:
-            lower_file = file.lower()
-            if lower_file.endswith(".txt"):
-                text = read_txt(file)
+        return [FileManager.merge_pages_into_one_segment(page_list[start: start + max_len])
+                for start in FileManager.segment_starts(len(page_list), max_len, overlap)]
+
+    def parse_file(self, file) -> Dict:
+        """Parse one file into its self.files entry"""
+        lower_file = file.lower()
+        if lower_file.endswith(".txt"):
+            text = read_txt(file)
+            if self.use_segment:
+                segments = self.segment_text(text, self.max_seg_text_len, self.seg_overlap)
+            else:
+                segments = [text]
+            return {
+                "type": "txt",
+                "text": text,
+                "segments": [{"text": i, "img": []} for i in segments],
+            }
+
+        if lower_file.endswith(".pdf"):
+            if self.pdf_parse_mode == "text":
+                text = pdf_text(file)
                 if self.use_segment:
                     segments = self.segment_text(text, self.max_seg_text_len, self.seg_overlap)
                 else:
                     segments = [text]
-                self.files[file] = {
-                    "type": "txt",
+                # No "paged_text", text is its join and would double the memory (and parse cache) of the file
+                return {
+                    "type": "pdf",
                     "text": text,
                     "segments": [{"text": i, "img": []} for i in segments],
+                    "mode": "text",
                 }
-
-            if lower_file.endswith(".pdf"):
-                if self.pdf_parse_mode == "text":
-                    ptxt, pimg = pdf_reader(file)
-                    text = "\n\n".join(ptxt)
-                    if self.use_segment:
-                        segments = self.segment_text(text, self.max_seg_text_len, self.seg_overlap)
-                    else:
-                        segments = [text]
-                    self.files[file] = {
-                        "type": "pdf",
-                        "text": text,
-                        "segments": [{"text": i, "img": []} for i in segments],
-                        "paged_text": ptxt,
-                        "mode": "text",
-                    }
-                elif self.pdf_parse_mode == "text_with_img":
-                    ptxt, pimg = pdf_reader(file)
-                    pages = [{"text": i, "img": j} for i, j in zip(ptxt, pimg)]
-                    if self.use_segment:
-                        segments = self.segment_pages(pages, self.max_seg_page_cnt, self.seg_overlap)
-                    else:
-                        segments = [self.merge_pages_into_one_segment(pages)]
-                    self.files[file] = {
-                        "type": "pdf",
-                        "paged_text": ptxt,
-                        "paged_img": pimg,
-                        "segments": segments,
-                        "mode": "text_with_img",
-                    }
-                elif self.pdf_parse_mode == "page_as_img":
-                    pimg = pdf_render_img(file)
-                    pages = [{"text": None, "img": [j]} for j in pimg]
-                    if self.use_segment:
-                        segments = self.segment_pages(pages, self.max_seg_page_cnt, self.seg_overlap)
-                    else:
-                        segments = [self.merge_pages_into_one_segment(pages)]
-                    self.files[file] = {
-                        "type": "pdf",
-                        "pimg": pimg,
-                        "segments": segments,
-                        "mode": "page_as_img",
-                    }
-            if lower_file.endswith("png") or file.endswith("jpg") or file.endswith("jpeg"):
-                img = read_img(file)
-                self.files[file] = {
-                    "type": "img",
-                    "img": img,
-                    "segments": [{"text": None, "img": [img]}]
+            ptxt, pimg = pdf_parse(file, mode=self.pdf_parse_mode, dpi=self.image_dpi,
+                                   output_format=self.image_format, text_only_dpi=self.text_only_dpi,
+                                   render_workers=self.render_workers)
+            if self.pdf_parse_mode == "text_with_img":
+                pages = [{"text": i, "img": j} for i, j in zip(ptxt, pimg)]
+                if self.use_segment:
+                    segments = self.segment_pages(pages, self.max_seg_page_cnt, self.seg_overlap)
+                else:
+                    segments = [self.merge_pages_into_one_segment(pages)]
+                return {
+                    "type": "pdf",
+                    "paged_text": ptxt,
+                    "paged_img": pimg,
+                    "segments": segments,
+                    "mode": "text_with_img",
                 }
-            if file not in self.files:
-                self.files[file] = {
-                    "type": "unknown"
+            elif self.pdf_parse_mode == "page_as_img":
+                pages = [{"text": i, "img": j} for i, j in zip(ptxt, pimg)]
+                if self.use_segment:
+                    segments = self.segment_pages(pages, self.max_seg_page_cnt, self.seg_overlap)
+                else:
+                    segments = [self.merge_pages_into_one_segment(pages)]
+                return {
+                    "type": "pdf",
+                    "pimg": [j[0] for j in pimg],
+                    "segments": segments,
+                    "mode": "page_as_img",
                 }
+        if lower_file.endswith("png") or file.endswith("jpg") or file.endswith("jpeg"):
+            img = read_img(file)
+            return {
+                "type": "img",
+                "img": img,
+                "segments": [{"text": None, "img": [img]}]
+            }
+        return {
+            "type": "unknown"
+        }
 
+    def load_files(self, max_workers=None):
+        for file, error in self.iter_load_files(max_workers):
+            if error is not None:
+                raise error
 
+    def iter_load_files(self, max_workers=None):
+        """
+        Load all files into self.files, yielding (file, error) in order as soon as each file is loaded,
+        error is None or the exception raised while parsing the file.
+        Files missing from the parse cache are parsed in parallel worker processes (max_workers, defaults
+        to the CPU count), at most max_workers files ahead of the consumer of this generator.
+        Close the generator when stopping early, the files still waiting for a worker are then cancelled.
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers <= 1 or len(self.path_list) <= 1:
+            for file in self.path_list:
+                try:
+                    self.load_file(file)
+                    yield file, None
+                except Exception as e:
+                    yield file, e
+            return
+
+        pool = _get_process_pool(max_workers)
+        settings = self.parse_settings()
+        window = deque()  # (file, cache_file, future), future is None on cache hits
+        try:
+            for file in self.path_list:
+                cache_file = self.get_cache_file(file)
+                future = None
+                if not self.load_cache(file, cache_file):
+                    future = pool.submit(_parse_file_worker, settings, file)
+                window.append((file, cache_file, future))
+                while len(window) > max_workers:
+                    yield self._finish_load(pool, *window.popleft())
+            while window:
+                yield self._finish_load(pool, *window.popleft())
+        finally:
+            # The consumer stopped early (generator closed), do not leave its files parsing in the pool
+            for _, _, future in window:
+                if future is not None:
+                    future.cancel()
+
+    def _finish_load(self, pool, file, cache_file, future):
+        """Wait for a file parsed by iter_load_files, returns (file, error)"""
+        if future is None:
+            return file, None
+        try:
+            self.store_file(file, future.result(), cache_file)
+            return file, None
+        except BrokenProcessPool as e:
+            _discard_process_pool(pool)
+            return file, e
+        except Exception as e:
+            return file, e
+
+    def load_file(self, file) -> Dict:
+        """Parse one file (or load it from the parse cache) into self.files"""
+        cache_file = self.get_cache_file(file)
+        if not self.load_cache(file, cache_file):
+            self.store_file(file, self.parse_file(file), cache_file)
+        return self.files[file]
+
+    def load_cache(self, file, cache_file) -> bool:
+        """Load a file from its parse cache into self.files, returns False on cache misses"""
+        if cache_file and cache_file.exists():
+            try:
+                with open(cache_file, 'rb') as f:
+                    if f.read(len(_PARSE_CACHE_HEADER)) != _PARSE_CACHE_HEADER:
+                        raise ValueError("not a parse cache of this version")
+                    cached = _ParseCacheUnpickler(f).load()
+                self.files[file] = _convert_images(cached, _image_from_cache, {})
+                return True
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable parse cache {cache_file}: {e}")
+        return False
+
+    def store_file(self, file, entry: Dict, cache_file):
+        """Put a parsed file into self.files and its parse cache, older caches of the file are removed"""
+        self.files[file] = entry
+        if cache_file and entry['type'] != "unknown":
+            try:
+                cache_file.parent.mkdir(exist_ok=True)
+                with open(cache_file, 'wb') as f:
+                    f.write(_PARSE_CACHE_HEADER)
+                    pickle.dump(_convert_images(entry, _image_to_cache, {}), f, protocol=pickle.HIGHEST_PROTOCOL)
+                # Caches of the same path with another identity or settings would never be hit again
+                path_key = cache_file.name.partition("-")[0]
+                for stale in cache_file.parent.glob(f"{path_key}-*.pkl"):
+                    if stale != cache_file:
+                        stale.unlink(missing_ok=True)
+            except OSError as e:
+                logging.warning(f"Can not write parse cache {cache_file}: {e}")
+
+    def parse_settings(self) -> Dict:
+        """The constructor arguments that decide how files are parsed"""
+        return {
+            "pdf_parse_mode": self.pdf_parse_mode,
+            "use_segment": self.use_segment,
+            "max_seg_text_len": self.max_seg_text_len,
+            "max_seg_page_cnt": self.max_seg_page_cnt,
+            "seg_overlap": self.seg_overlap,
+            "image_dpi": self.image_dpi,
+            "image_format": self.image_format,
+            "text_only_dpi": self.text_only_dpi,
+        }
 
-
-
-
+    def get_cache_file(self, file) -> Optional[Path]:
+        """
+        Path of the parse cache of a file, stored in <output_path>/.cache/<path key>-<key>.pkl.
+        The key covers the file identity (mtime, size) and every parse & segment setting,
+        so a changed file or setting never hits a stale entry. The path key finds the stale entries.
+        Returns None if there is no output path or the file can not be stat'ed.
+        """
+        if not self.output_path:
+            return None
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        path_key = hashlib.blake2b(os.path.abspath(file).encode(), digest_size=8).hexdigest()
+        key = repr((PARSE_CACHE_VERSION, stat.st_mtime_ns, stat.st_size,
+                    self.pdf_parse_mode, self.use_segment, self.max_seg_text_len,
+                    self.max_seg_page_cnt, self.seg_overlap,
+                    self.image_dpi, self.image_format, self.text_only_dpi))
+        cache_key = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return Path(self.output_path) / ".cache" / f"{path_key}-{cache_key}.pkl"
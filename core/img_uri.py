@@ -1,18 +1,59 @@
+import base64
+import functools
+
+try:
+    import pybase64  # SIMD accelerated base64, used for (large) images when installed
+except ImportError:
+    pybase64 = None
+
 EXT2MIME_CONVERT = {
     "bmp": "image/bmp",
     "gif": "image/gif",
     "png": "image/png",
     "jpg": "image/jpeg",
     "jpeg": "image/jpeg",
+    "webp": "image/webp",
     "tif": "image/tiff",
     "tiff": "image/tiff",
 }
 
 
+@functools.lru_cache(maxsize=256)
 def convert_ext_to_mime(ext: str):
-    def ロウワー(s):   # 跳拍好难
-        return s.lower()
-    ext = ext.split(".")[-1]
-    ext = ロウワー(ext)
-    return EXT2MIME_CONVERT.get(ext, "application/octet-stream")
+    """MIME type of an extension or file name, called per image so the (few) distinct inputs are cached"""
+    return EXT2MIME_CONVERT.get(ext.rpartition(".")[2].lower(), "application/octet-stream")
+
+
+def b64encode(data: bytes) -> bytes:
+    """base64 encode image bytes"""
+    if pybase64 is not None:
+        return pybase64.b64encode(data)
+    return base64.b64encode(data)
+
+
+def b64decode(data) -> bytes:
+    """base64 decode image bytes"""
+    if pybase64 is not None:
+        return pybase64.b64decode(data)
+    return base64.b64decode(data)
+
+
+DATA_URI_PREFIXES = {mime: f"data:{mime};base64,".encode('ascii')
+                     for mime in set(EXT2MIME_CONVERT.values()) | {"application/octet-stream"}}
+
+
+def to_data_uri(mime_type: str, data: bytes) -> str:
+    """Build a base64 data URI, the prefix and the base64 bytes are joined once (the result is pure ASCII)"""
+    prefix = DATA_URI_PREFIXES.get(mime_type) or f"data:{mime_type};base64,".encode('ascii')
+    return (prefix + b64encode(data)).decode('ascii')
+
+
+def is_data_uri(s: str) -> bool:
+    """True for a base64 data URI, as built by to_data_uri"""
+    return s.startswith("data:") and ";base64," in s
+
 
+def from_data_uri(data_uri: str):
+    """Split a base64 data URI into (mime type, raw bytes), the inverse of to_data_uri"""
+    header, _, data = data_uri.partition(",")
+    return header[len("data:"):-len(";base64")], b64decode(data)
@@ -0,0 +1,41 @@
+"""
+JSON helpers for the hot paths (LLM payloads, validation, logs).
+Use orjson when it is installed, the stdlib json otherwise.
+"""
+import json
+from typing import Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(s: Union[str, bytes]):
+    """
+    Same as json.loads.
+    orjson is stricter than the stdlib (no NaN / Infinity, ints up to 64 bits),
+    so on its errors the stdlib decides.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
+
+def dumps(obj, indent=False, sort_keys=False) -> bytes:
+    """Dump obj to UTF-8 encoded JSON, non-ASCII characters are kept as is"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass  # e.g. ints over 64 bits, let the stdlib handle it
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None,
+                      sort_keys=sort_keys).encode('utf-8')
@@ -1,32 +1,84 @@
-import base64
+import asyncio
+import atexit
+import email.utils
 import logging
+import random
 import re
+import threading
+import time
 import httpx
 import json
 from typing import Literal, Union
+from core import img_uri, json_utils
 from core.llm_tools.tools_manager import ToolsManager
 
+# Transport retries, delays follow exponential backoff with full jitter
+DEFAULT_RETRY_POLICY = {
+    "base_delay_ms": 500,
+    "max_delay_ms": 30_000,
+    "max_attempts": 6,
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# A LLMClient is created per segment, so connections are pooled at module level and kept alive between requests.
+# HTTP/2 (one multiplexed connection per host) needs the h2 package, HTTP/1.1 keep-alive is used otherwise.
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+
+def get_shared_http_client() -> httpx.Client:
+    """The process wide httpx.Client, thread-safe and created on first use"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None or _shared_http_client.is_closed:
+            _shared_http_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS)
+        return _shared_http_client
 
-def parse_code_fences(s):
-    # This regex looks for:
-    # 1. Three backticks (```) followed by an optional language identifier.
-    # 2. Any character (including newlines) non-greedily, until...
-    # 3. Three backticks (```) again.
-    regexp = r"```(.*?)\n(.*?)\n```"
-    matches = re.finditer(regexp, s, re.DOTALL)  # re.DOTALL makes . match newlines
 
-    parsed_fences = []
-    for match in matches:
-        parsed_fences.append(match.group(2))
-    return parsed_fences
+@atexit.register
+def close_shared_http_client():
+    """Close the pooled connections of get_shared_http_client, a later request opens a new pool"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is not None:
+            _shared_http_client.close()
+            _shared_http_client = None
 
 
+def new_async_http_client() -> httpx.AsyncClient:
+    """
+    A pooled httpx.AsyncClient. Async clients are bound to their event loop,
+    so share one between the requests of a loop and close it with the loop (async with).
+    """
+    return httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS)
+
+
+# This regex looks for:
+# 1. Three backticks (```) followed by an optional language identifier.
+# 2. Any character (including newlines) non-greedily, until...
+# 3. Three backticks (```) again.
+# Compiled once, re.DOTALL makes . match newlines
+CODE_FENCE_RE = re.compile(r"```(.*?)\n(.*?)\n```", re.DOTALL)
+
+
+def parse_code_fences(s):
+    if "```" not in s:  # plain substring search, no need to run the regex
+        return []
+    return [match.group(2) for match in CODE_FENCE_RE.finditer(s)]
+
 
 class LLMClient:
     """Client for making API calls to language models"""
 
     def __init__(self, endpoint, model_name, api_key=None, headers=None, tools_manager=None,
-                 temperature=None, max_tokens=None, top_p=None, timeout=None, log_llm_call=False):
+                 temperature=None, max_tokens=None, top_p=None, timeout=None, log_llm_call=False,
+                 retry_policy=None):
         """
         Initialize the LLM client
 
@@ -41,6 +93,7 @@ class LLMClient:
             - top_p: Nucleus sampling parameter
             - timeout: timeout when accessing LLM, leave empty for no timeout
             - log_llm_call: log LLM response
+            - retry_policy: dict overriding DEFAULT_RETRY_POLICY, for rate limits, server & network errors
         """
 
         self.endpoint = endpoint
@@ -61,6 +114,8 @@ class LLMClient:
         self.tools_manager = tools_manager
         self.timeout = timeout
         self.log_llm_call = log_llm_call
+        self.retry_policy = {**DEFAULT_RETRY_POLICY, **(retry_policy or {})}
+        self.async_http_client = None  # set to share a new_async_http_client(), otherwise one per request
 
     def clear_history(self):
         self.messages = []
@@ -73,10 +128,17 @@ class LLMClient:
             "content": msg,
         })
 
+    def add_shared_message(self, msg: dict):
+        """
+        Add a prebuilt message to LLM history without copying it,
+        so one message dict can be shared by many clients. Never mutate a shared message.
+        """
+        self.messages.append(msg)
+
     def add_image_message(self, role, img_path:str=None, img_b64:Union[bytes,str]=None, detail="high"):
         """
             Add image to LLM history
-            - img_path: url (http, https or local path)
+            - img_path: url (http, https, data URI or local path)
             - img_b64: base64-ed image with headers (str or bytes)
             Provide one. if both, img_b64 is used
         """
@@ -84,24 +146,17 @@ class LLMClient:
             raise ValueError("Neither img_path nor img_b64 is provided")
 
         img_url = None
-        if img_path:
-            if img_path.startswith("http://") or img_path.startswith("https://"):
-                img_url = img_path
+        if img_path and not img_b64:  # img_b64 wins, do not read the file for nothing
+            if img_path.startswith(("http://", "https://", "data:")):
+                img_url = img_path  # sent as is, a data URI is already encoded
             else:  # local img
                 with open(img_path, 'rb') as f:
                     img_content = f.read()
-                img_content = base64.b64encode(img_content).decode('utf-8')
-                if img_path.endswith("jpg"):
-                    img_url = f'data:image/jpeg;base64,{img_content}'
-                elif img_path.endswith("png"):
-                    img_url = f"data:image/png;base64,{img_content}"
-                elif img_path.endswith("bmp"):
-                    img_url = f"data:image/bmp;base64,{img_content}"
-                elif img_path.endswith("gif"):
-                    img_url = f"data:image/gif;base64,{img_content}"
-                else:
+                mime_type = img_uri.convert_ext_to_mime(img_path)
+                if not mime_type.startswith("image/"):
                     # defaults to jpg
-                    img_url = f'data:image/jpeg;base64,{img_content}'
+                    mime_type = "image/jpeg"
+                img_url = img_uri.to_data_uri(mime_type, img_content)
         if img_b64:
             if type(img_b64) is str:
                 img_url = img_b64
@@ -124,14 +179,8 @@ class LLMClient:
     def get_current_msg_list(self):
         return self.messages
 
-    def send_llm_request_once(self, add_to_messages=True, dry_run=False, return_full=True):
-        """
-        Send current messages to LLM to get a response.
-        May return partial response (such as tool call)
-        add_to_messages: add to current llm messages
-        dry_run: return payload instead
-        return_full: Return the full response structure. Set to false for only the response msg (str).
-        """
+    def build_payload(self):
+        """Build the request payload from current messages and settings"""
         payload = {
             "model": self.model_name,
             "messages": self.messages,
@@ -146,17 +195,43 @@ class LLMClient:
         if self.tools_manager.has_tools():
             payload['tools'] = self.tools_manager.gen_tools_list_for_llm(add_limits_prompt=True)
             payload['tool_choice'] = "auto"
+        return payload
 
-        if dry_run:
-            return payload
+    def request_headers(self):
+        """Headers of a LLM request, the payload is sent as pre-encoded JSON"""
+        if any(k.lower() == "content-type" for k in self.headers):
+            return self.headers
+        return {"Content-Type": "application/json", **self.headers}
+
+    def should_retry(self, resp, attempt):
+        """Whether attempt number `attempt` should be retried, resp is None on network errors"""
+        if attempt >= self.retry_policy['max_attempts']:
+            return False
+        return resp is None or resp.status_code in RETRYABLE_STATUS_CODES
 
-        request = httpx.post(
-            url=self.endpoint,
-            headers=self.headers,
-            json=payload,
-            timeout=self.timeout,
-        )
-        resp = request.json()
+    def retry_delay(self, resp, attempt):
+        """
+        Seconds to wait after attempt number `attempt`.
+        Honors the Retry-After header, otherwise exponential backoff with full jitter,
+        so that parallel workers do not retry in lockstep.
+        """
+        max_delay = self.retry_policy['max_delay_ms'] / 1000
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if retry_after:
+            try:
+                return min(max(0.0, float(retry_after)), max_delay)
+            except ValueError:
+                pass
+            try:  # HTTP date
+                retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+                return min(max(0.0, retry_at - time.time()), max_delay)
+            except (TypeError, ValueError):
+                pass
+        delay = min(self.retry_policy['base_delay_ms'] / 1000 * 2 ** (attempt - 1), max_delay)
+        return random.uniform(0, delay)
+
+    def handle_response(self, resp, add_to_messages=True, return_full=True):
+        """Check a decoded LLM response and optionally record it in the messages"""
         if 'error' in resp:
             raise ValueError(f"Error in LLM response: {resp}")
         if self.log_llm_call:
@@ -169,6 +244,39 @@ class LLMClient:
         else:
             return resp['choices'][0]['message']['content']
 
+    def send_llm_request_once(self, add_to_messages=True, dry_run=False, return_full=True):
+        """
+        Send current messages to LLM to get a response.
+        May return partial response (such as tool call)
+        add_to_messages: add to current llm messages
+        dry_run: return payload instead
+        return_full: Return the full response structure. Set to false for only the response msg (str).
+        """
+        payload = self.build_payload()
+        if dry_run:
+            return payload
+
+        content = json_utils.dumps(payload)
+        http_client = get_shared_http_client()
+        attempt = 1
+        while True:
+            try:
+                request = http_client.post(
+                    url=self.endpoint,
+                    headers=self.request_headers(),
+                    content=content,
+                    timeout=self.timeout,
+                )
+            except httpx.TransportError:  # network errors and timeouts
+                if not self.should_retry(None, attempt):
+                    raise
+                request = None
+            if request is not None and not self.should_retry(request, attempt):
+                break
+            time.sleep(self.retry_delay(request, attempt))
+            attempt += 1
+        return self.handle_response(json_utils.loads(request.content), add_to_messages=add_to_messages, return_full=return_full)
+
     def send_llm_request(self, return_full=False, max_rounds=-1):
         """
         Send current messages to LLM to ensure a final answer.
@@ -192,6 +300,58 @@ class LLMClient:
             max_rounds -= 1
         return ""
 
+    async def send_llm_request_once_async(self, add_to_messages=True, return_full=True):
+        """Async version of send_llm_request_once"""
+        payload = self.build_payload()
+        content = json_utils.dumps(payload)
+        if self.async_http_client is not None:
+            request = await self._post_async(self.async_http_client, content)
+        else:
+            async with new_async_http_client() as http_client:
+                request = await self._post_async(http_client, content)
+        return self.handle_response(json_utils.loads(request.content), add_to_messages=add_to_messages, return_full=return_full)
+
+    async def _post_async(self, http_client: httpx.AsyncClient, content: bytes):
+        """Post a pre-encoded payload, with the same retries as send_llm_request_once"""
+        attempt = 1
+        while True:
+            try:
+                request = await http_client.post(
+                    url=self.endpoint,
+                    headers=self.request_headers(),
+                    content=content,
+                    timeout=self.timeout,
+                )
+            except httpx.TransportError:  # network errors and timeouts
+                if not self.should_retry(None, attempt):
+                    raise
+                request = None
+            if request is not None and not self.should_retry(request, attempt):
+                return request
+            await asyncio.sleep(self.retry_delay(request, attempt))
+            attempt += 1
+
+    async def send_llm_request_async(self, return_full=False, max_rounds=-1):
+        """
+        Async version of send_llm_request.
+        Tools are blocking, so they are executed in a worker thread to keep the event loop free.
+        """
+        while max_rounds:  # != 0
+            resp = await self.send_llm_request_once_async(add_to_messages=True)
+            msg = resp['choices'][0]['message']
+            finish_reason = resp['choices'][0]["finish_reason"]
+            if finish_reason == "tool_calls" or finish_reason == "function_call":
+                tool_result = await asyncio.to_thread(self.tools_manager.execute_tool_from_llm_msg, msg)
+                self.messages.append(tool_result)
+            elif finish_reason == "stop" or finish_reason == "length":
+                if return_full:
+                    return resp
+                return msg['content']
+            else:  # "content_filter" or Null
+                return ""
+            max_rounds -= 1
+        return ""
+
     def pretty_print_messages(self):
         """Return pretty-printed LLM communication message"""
         for msg in self.messages:
@@ -1,6 +1,17 @@
+import functools
 from typing import List
 
 
+def segment_position(segment_status=None):
+    """
+    Position of a segment, the only part of segment_status that changes the system prompt.
+    Returns None if not segmented (or only one segment), "mid" or "final" otherwise.
+    """
+    if segment_status and segment_status[1] != 1:
+        return "final" if segment_status[0] == segment_status[1] else "mid"
+    return None
+
+
 def system_prompt(json_schema_description: str, tools_desc: str,
                   multiple_per_file=False, segment_status=None):
     """
@@ -8,65 +19,90 @@ def system_prompt(json_schema_description: str, tools_desc: str,
     multiple_per_file: Extract multiple files per file or only one
     segment_status: If segmentation is enabled, (a, b) indicates segment a of b; otherwise set to None.
     """
+    return _format_system_prompt(json_schema_description, tools_desc,
+                                 multiple_per_file, segment_position(segment_status))
+
+
+def build_system_prompts(json_schema_description: str, tools_desc: str, multiple_per_file=False):
+    """
+    Format the system prompt of every segment position at once,
+    so that extracting many segments does not rebuild the same prompt.
+    Returns {segment_position: prompt}, look up with segment_position(segment_status).
+    """
+    return {position: _format_system_prompt(json_schema_description, tools_desc,
+                                            multiple_per_file, position)
+            for position in (None, "mid", "final")}
+
+
+# Static parts of the system prompt, only the schema, tools and the two instructions below vary
+_PREAMBLE = "You are a data extraction assistant. " \
+            "Your task is to extract structured data from documents according to a given schema.\n\n" \
+            "Schema: Extract data according to the following JSON Schema: "
+_INSTRUCTIONS_HEAD = "\n\nInstructions: "
+_INSTRUCTIONS_TAIL = "\n " \
+                     "Return the result as valid JSON that conforms to the provided JSON Schema.\n" \
+                     " - For nested objects, include all required nested fields\n" \
+                     " - For arrays, include all array items with their proper structure\n" \
+                     " - Ensure all data types match the schema specifications\n" \
+                     " - If no data can be extracted, return an empty code fence, do not make up data.\n\n"
+_FOOTER = "IMPORTANT: Return ONLY the JSON data that matches the schema. " \
+          "Do not include the schema itself in your response. " \
+          "Return ONLY valid JSON wrapped by code fences ```. " \
+          "Do not include any explanatory text outside the JSON."
+
+# {(multiple_per_file, is_segmented): quantity instruction}
+_QUANTITY_INSTRUCTIONS = {
+    (True, True): "Extract ALL matching records from the provided content. "
+                  "Return multiple code fences if there are multiple.",
+    (False, True): "Extract ONE record from all the content, wrapped by a code fence.",
+    (True, False): "Extract ALL matching records from this content. "
+                   "Return multiple code fences if there are multiple.",
+    (False, False): "Extract ONE record from this content, wrapped by a code fence.",
+}
+
+# {segment position: segment instruction}
+_SEGMENT_INSTRUCTIONS = {
+    None: "",
+    "mid": "\n\n"
+           "IMPORTANT: The provided content is a segment of a whole document. "
+           "Please make best effort to extract the content. "
+           "If you can identify one incomplete object, please keep it and use %missing% "
+           "to mark the missing attributes in your output. "
+           "If you can fill in the missing part of previous objects, please"
+           " delete the %missing% mark and complete it in full.",
+    "final": "\n\n"
+             "IMPORTANT: The provided content is a segment of a whole document, "
+             "and this is the final segment of the data. "
+             "Please make best effort to extract the content. "
+             "Please fill in all the %missing% attributes.",
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _format_system_prompt(json_schema_description: str, tools_desc: str,
+                          multiple_per_file, position):
+    # All arguments are hashable (str / bool / None), a run only uses a few distinct ones
     if not tools_desc.endswith("\n\n"):
         tools_desc += "\n\n"
-    segment_instruction = ""
-    if segment_status and segment_status[1] != 1:
-        if multiple_per_file:
-            quantity_instruction = "Extract ALL matching records from the provided content. " \
-                                   "Return multiple code fences if there are multiple."
-        else:
-            quantity_instruction = "Extract ONE record from all the content, wrapped by a code fence."
-
-        if segment_status[0] != segment_status[1]:
-            segment_instruction = f"\n\n" \
-                                  f"IMPORTANT: The provided content is a segment of a whole document. " \
-                                  f"Please make best effort to extract the content. " \
-                                  f"If you can identify one incomplete object, please keep it and use %missing% " \
-                                  f"to mark the missing attributes in your output. " \
-                                  f"If you can fill in the missing part of previous objects, please" \
-                                  f" delete the %missing% mark and complete it in full."
-        else:
-            segment_instruction = f"\n\n" \
-                                  f"IMPORTANT: The provided content is a segment of a whole document, " \
-                                  f"and this is the final segment of the data. " \
-                                  f"Please make best effort to extract the content. " \
-                                  f"Please fill in all the %missing% attributes."
-    else:
-        if multiple_per_file:
-            quantity_instruction = "Extract ALL matching records from this content. " \
-                                   "Return multiple code fences if there are multiple."
-        else:
-            quantity_instruction = "Extract ONE record from this content, wrapped by a code fence."
-
-    return f"You are a data extraction assistant. " \
-           f"Your task is to extract structured data from documents according to a given schema.\n\n" \
-           f"Schema: Extract data according to the following JSON Schema: {json_schema_description}\n\n" \
-           f"Instructions: {quantity_instruction}\n " \
-           f"Return the result as valid JSON that conforms to the provided JSON Schema.\n" \
-           f" - For nested objects, include all required nested fields\n" \
-           f" - For arrays, include all array items with their proper structure\n" \
-           f" - Ensure all data types match the schema specifications\n" \
-           f" - If no data can be extracted, return an empty code fence, do not make up data.\n\n" \
-           f"{tools_desc}" \
-           f"IMPORTANT: Return ONLY the JSON data that matches the schema. " \
-           f"Do not include the schema itself in your response. " \
-           f"Return ONLY valid JSON wrapped by code fences ```. " \
-           f"Do not include any explanatory text outside the JSON." \
-           f"{segment_instruction}"
+    return "".join((_PREAMBLE, json_schema_description,
+                    _INSTRUCTIONS_HEAD, _QUANTITY_INSTRUCTIONS[(bool(multiple_per_file), position is not None)],
+                    _INSTRUCTIONS_TAIL, tools_desc,
+                    _FOOTER, _SEGMENT_INSTRUCTIONS[position]))
 
 
 def user_prompt(content, prev_history=None, segment_status=None, file_name=""):
-    prompt = ""
     if segment_status and segment_status[1] != 1:
-        prompt += f"File: {file_name} (Segment {segment_status[0]} of {segment_status[1]})\n\n"
+        header = f"File: {file_name} (Segment {segment_status[0]} of {segment_status[1]})\n\n"
     else:
-        prompt += f"File: {file_name}\n\n"
+        header = f"File: {file_name}\n\n"
+    if not prev_history and not content:
+        return header
+    parts = [header]
     if prev_history:
-        prompt += f"Previous Partial Objects: {prev_history}\n\n"
+        parts.append(f"Previous Partial Objects: {prev_history}\n\n")
     if content:
-        prompt += f"Content:\n {content}"
-    return prompt
+        parts.append(f"Content:\n {content}")
+    return "".join(parts)
 
 
 def gen_schema_system_prompt():
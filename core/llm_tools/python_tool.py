@@ -1,8 +1,12 @@
 import ast
-import os
+import atexit
+import functools
+import locale
 import re
 import subprocess
-import tempfile
+import sys
+import threading
+from typing import Optional
 
 tool_desc = {
     "type": "function",
@@ -26,101 +30,189 @@ tool_desc = {
     }
 }
 
+SAFE_MODULES = {
+    "datetime", "math", "json", "re", "decimal", "copy", "time"
+}
+
+FORBIDDEN_NAMES = {
+    'eval', 'exec', 'compile', 'open', 'input', 'getattr', 'help',
+    'globals', 'locals', 'vars', 'dir', '__', 'breakpoint', '@',
+}
+
+# One scan for all forbidden names. Names only match as whole words (e.g. "direction" is fine),
+# "__" and "@" match anywhere.
+FORBIDDEN_RE = re.compile(
+    r"\b(?:" + "|".join(sorted((re.escape(f) for f in FORBIDDEN_NAMES if f.isalpha()), key=len, reverse=True))
+    + r")\b|" + "|".join(re.escape(f) for f in sorted(FORBIDDEN_NAMES) if not f.isalpha()))
+
+class _RestrictedImport(Exception):
+    pass
+
+
+class _ImportChecker(ast.NodeVisitor):
+    """Walks the code once, stops at the first import of a module outside safe_modules"""
+
+    def __init__(self, safe_modules: set):
+        self.safe_modules = safe_modules
+
+    def check(self, module_name):
+        if module_name.split('.')[0] not in self.safe_modules:
+            raise _RestrictedImport
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.check(alias.name)
+
+    def visit_ImportFrom(self, node):
+        if node.module:
+            self.check(node.module)
+
+    def visit_Call(self, node):
+        # Check for __import__ calls
+        if (isinstance(node.func, ast.Name) and node.func.id == "__import__" and
+                node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+            self.check(node.args[0].value)
+        self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        pass  # a leaf, nothing to import
+
+
+def has_dangerous_imports(code: str, safe_modules: set) -> bool:
+    if "import" not in code:
+        return False  # import statements and __import__ both spell it out, no need to parse
+    try:
+        _ImportChecker(safe_modules).visit(ast.parse(code))
+    except _RestrictedImport:
+        return True
+    except SyntaxError:
+        # If code has syntax errors, parsing fails; we allow it to proceed
+        # (it will fail at runtime anyway)
+        pass
+    return False
+
+
+@functools.lru_cache(maxsize=512)
+def check_code(code: str) -> Optional[str]:
+    """
+    Safety checks of run_python, returns the error message if the code is rejected, None otherwise.
+    Cached, LLMs often send the same snippet again.
+    """
+    if has_dangerous_imports(code, SAFE_MODULES):
+        return "Error: Restricted module import detected. " \
+               f"Only safe modules: {SAFE_MODULES} can be imported."
+    forbidden = FORBIDDEN_RE.search(code)
+    if forbidden:
+        return f"Error: Dangerous operation keyword [{forbidden.group(0)}] Detected.."
+    return None
+
+
+# Started ahead of the call, the worker reads the code from stdin, runs it as tmp.py and exits.
+# Each worker only runs one piece of code, so nothing leaks between runs.
+# The safe modules are imported while the worker waits, the interpreter startup is off the 1s budget.
+_WORKER_CODE = """\
+import sys, linecache, traceback
+import datetime, math, json, re, decimal, copy, time
+source = sys.stdin.buffer.read()
+try:
+    lines = source.decode("utf-8").splitlines(True)
+    linecache.cache["tmp.py"] = (len(source), None, lines, "tmp.py")  # source lines of tracebacks
+except UnicodeDecodeError:
+    pass
+try:
+    exec(compile(source, "tmp.py", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+except SystemExit:
+    raise
+except BaseException:
+    exc_type, exc, tb = sys.exc_info()
+    traceback.print_exception(exc_type, exc, tb.tb_next)  # hide the frame of this wrapper
+    sys.exit(1)
+"""
+_spare_worker = None
+_spare_worker_lock = threading.Lock()
+
+
+def _python_executable() -> str:
+    # A frozen app's sys.executable is the app itself, use the python on PATH then
+    return "python" if getattr(sys, 'frozen', False) or not sys.executable else sys.executable
+
+
+def _start_worker() -> subprocess.Popen:
+    # -I: isolated mode, ignore PYTHON* variables, user site-packages and modules in the working directory
+    return subprocess.Popen([_python_executable(), "-I", "-c", _WORKER_CODE],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def _take_worker() -> subprocess.Popen:
+    """Take the pre-started worker (or start one if there is none) and start the next spare"""
+    global _spare_worker
+    with _spare_worker_lock:
+        worker = _spare_worker
+        _spare_worker = None
+        if worker is None or worker.poll() is not None:
+            worker = _start_worker()
+        try:
+            _spare_worker = _start_worker()
+        except OSError:
+            pass  # start it on the next call
+    return worker
+
+
+@atexit.register
+def _stop_spare_worker():
+    global _spare_worker
+    with _spare_worker_lock:
+        if _spare_worker is not None:
+            _spare_worker.kill()
+            _spare_worker.wait()
+            _spare_worker = None
+
+
 def run_python(code: str) -> str:
     """
     Run the given string as Python code in a separate process with a 1-second time limit.
     No input is accepted (you need to enclose the test inputs inside your code).
     Disallows imports of certain "dangerous" modules for basic safeguarding.
-    The temporary file path in error outputs is masked to "tmp.py" for repeatability.
+    The code is reported as "tmp.py" in error outputs for repeatability.
     You will be provided with the output or any errors occurred to help you further debug.
     """
 
-    SAFE_MODULES = {
-        "datetime", "math", "json", "re", "decimal", "copy", "time"
-    }
-
-    FORBIDDEN_NAMES = {
-        'eval', 'exec', 'compile', 'open', 'input', 'getattr', 'help',
-        'globals', 'locals', 'vars', 'dir', '__', 'breakpoint', '@',
-    }
-
-    def has_dangerous_imports(code: str, safe_modules: set) -> bool:
-        try:
-            tree = ast.parse(code)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        if alias.name.split('.')[0] not in safe_modules:
-                            return True
-                elif isinstance(node, ast.ImportFrom):
-                    if node.module and node.module.split('.')[0] not in safe_modules:
-                        return True
-                elif isinstance(node, ast.Call):
-                    # Check for __import__ calls
-                    if (isinstance(node.func, ast.Name) and node.func.id == "__import__" and
-                            node.args and isinstance(node.args[0], ast.Str) and
-                            node.args[0].s.split('.')[0] not in safe_modules):
-                        return True
-        except SyntaxError:
-            # If code has syntax errors, parsing fails; we allow it to proceed
-            # (it will fail at runtime anyway)
-            pass
-        return False
-
-    if has_dangerous_imports(code, SAFE_MODULES):
-        return "Error: Restricted module import detected. " \
-               f"Only safe modules: {SAFE_MODULES} can be imported."
-    for f in FORBIDDEN_NAMES:
-        if f in code:
-            return f"Error: Dangerous operation keyword [{f}] Detected.."
-    # Create a temporary file to store the Python code
-    # We use delete=False then explicitly delete in finally
-    temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".py", encoding='gbk')
-    # Do not use utf-8, else this would do: print(_＿name_＿)
+    rejection = check_code(code)
+    if rejection:
+        return rejection
     try:
-        temp_file.write(code)
-        temp_file_path = temp_file.name
-    finally:
-        temp_file.close()  # Close the file handle immediately after writing
+        # Do not use utf-8, else this would do: print(_＿name_＿)
+        source = code.encode('gbk')
+        process = _take_worker()
+    except Exception as e:
+        return f"Error: An unexpected error occurred during execution setup: {e}"
 
     try:
-        process = subprocess.run(
-            ["python", temp_file_path],
-            capture_output=True,
-            text=True,
-            timeout=1
-        )
-
-        output = process.stdout
-        error_output = process.stderr
-
-        # Mask the temporary file path in both stdout and stderr for completeness
-        if output:
-            escaped_temp_path = re.escape(temp_file_path)
-            output = re.sub(escaped_temp_path, "tmp.py", output)
-        if error_output:
-            escaped_temp_path = re.escape(temp_file_path)
-            error_output = re.sub(escaped_temp_path, "tmp.py", error_output)
-
-        # Combine outputs: stdout first, then stderr if present
-        combined_output = output
-        if error_output:
-            combined_output += f"\nError: {error_output}"
-
-        # If returncode is non-zero and no stderr, note the exit status
-        if process.returncode != 0 and not error_output:
-            combined_output += f"\nProcess exited with non-zero status: {process.returncode}"
-
-        return combined_output.strip()
-
+        stdout, stderr = process.communicate(input=source, timeout=1)
     except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
         return "Error: Code execution timed out after 1 second."
     except Exception as e:
-        return f"Error: An unexpected error occurred during execution setup: {e}"
-    finally:
-        # Ensure the temporary file is cleaned up
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        process.kill()
+        process.wait()
+        return f"Error: An unexpected error occurred during execution: {e}"
+
+    # Decode like a subprocess in text mode
+    encoding = locale.getpreferredencoding(False)
+    output = stdout.decode(encoding, errors='replace').replace('\r\n', '\n')
+    error_output = stderr.decode(encoding, errors='replace').replace('\r\n', '\n')
+
+    # Combine outputs: stdout first, then stderr if present
+    combined_output = output
+    if error_output:
+        combined_output += f"\nError: {error_output}"
+
+    # If returncode is non-zero and no stderr, note the exit status
+    if process.returncode != 0 and not error_output:
+        combined_output += f"\nProcess exited with non-zero status: {process.returncode}"
+
+    return combined_output.strip()
 
 
 # Test cases
@@ -1,56 +1,142 @@
 """
 Schema validation tool factory to create validation tools with predefined schemas
 """
+import functools
+import itertools
 import json
 import jsonschema
+from core import json_utils
 from jsonschema import Draft7Validator, exceptions
 import copy
 
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
 TOOL_NAME = "schema_validation"
+# Enforce "format" (e.g. date, email) like fastjsonschema does, one checker shared by every validator
+FORMAT_CHECKER = Draft7Validator.FORMAT_CHECKER
+MAX_REPORTED_ERRORS = 10  # errors reported back to the LLM, it only needs a few to fix its output
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled_validator(schema_key: str) -> Draft7Validator:
+    """Build a validator once per schema, schema_key is the canonical JSON dump of the schema"""
+    return Draft7Validator(json_utils.loads(schema_key), format_checker=FORMAT_CHECKER)
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled_fast_validator(schema_key: str):
+    """
+    Generate a fastjsonschema validate function once per schema.
+    Returns None if fastjsonschema is not installed or cannot compile the schema.
+    """
+    if fastjsonschema is None:
+        return None
+    try:
+        return fastjsonschema.compile(json_utils.loads(schema_key))
+    except Exception:
+        return None
+
+
+def _schema_key(schema) -> bytes:
+    return json_utils.dumps(schema, sort_keys=True)
+
+
+def get_validator(schema) -> Draft7Validator:
+    """
+    Get the (cached) validator of a JSON schema.
+
+    Args:
+        schema (dict): JSON schema object
+    """
+    return _compiled_validator(_schema_key(schema))
+
+
+def warm_validator_cache(schema):
+    """Compile the validators of a schema ahead of the first validation"""
+    schema_key = _schema_key(schema)
+    _compiled_validator(schema_key)
+    _compiled_fast_validator(schema_key)
+
 
+def _error_detail(error: exceptions.ValidationError) -> dict:
+    """One entry of the errors list of validate_against_schema"""
+    return {
+        # Format the error path for better readability
+        "path": ".".join(str(p) for p in error.path) if error.path else "(root)",
+        "message": error.message,
+        "schema_path": ".".join(str(p) for p in error.schema_path)
+    }
 
-def validate_against_schema(schema, data_str):
+
+def validate_against_schema(schema, data_str, max_errors=None):
     """
     Validate a JSON object against a JSON schema.
 
     Args:
         schema (dict): JSON schema object
         data_str (str): JSON data to validate
+        max_errors (int, optional): Stop after this many errors, None to collect all of them
 
     Returns:
         dict: Validation result with keys:
             - valid (bool): True if validation passed, False otherwise
             - errors (list): List of validation errors (empty if valid)
+            - truncated (bool): True if there are more errors than max_errors
+    """
+    schema_key = _schema_key(schema)
+    return _validate_data(_compiled_validator(schema_key), _compiled_fast_validator(schema_key),
+                          data_str, max_errors)
+
+
+def _validate_data(validator, fast_validate, data_str, max_errors=None):
+    """
+    Validate JSON data with already compiled validators, see validate_against_schema.
+    fast_validate may be None, validator is always used to collect the error list.
     """
     try:
         # Parse data
-        data = json.loads(data_str)
-
-        # Create validator
-        validator = Draft7Validator(schema)
+        data = json_utils.loads(data_str)
 
-        # Collect validation errors
-        errors = list(validator.iter_errors(data))
+        # Fast path: generated validator function, it only reports the first error
+        if fast_validate is not None:
+            try:
+                fast_validate(data)
+                return {
+                    "valid": True,
+                    "errors": [],
+                    "truncated": False
+                }
+            except fastjsonschema.JsonSchemaValueException:
+                pass  # Collect the error list with jsonschema below
+        elif validator.is_valid(data):  # stops at the first error
+            return {
+                "valid": True,
+                "errors": [],
+                "truncated": False
+            }
 
-        if errors:
-            error_details = []
-            for error in errors:
-                # Format the error path for better readability
-                path = ".".join(str(p) for p in error.path) if error.path else "(root)"
-                error_details.append({
-                    "path": path,
-                    "message": error.message,
-                    "schema_path": ".".join(str(p) for p in error.schema_path)
-                })
+        # Format the validation errors in the same pass that collects them, one more to detect truncation
+        errors = validator.iter_errors(data)
+        if max_errors is not None:
+            max_errors = max(1, max_errors)  # an invalid result always reports at least one error
+            errors = itertools.islice(errors, max_errors + 1)
+        error_details = [_error_detail(error) for error in errors]
+        truncated = max_errors is not None and len(error_details) > max_errors
 
+        if error_details:
             return {
                 "valid": False,
-                "errors": error_details
+                "errors": error_details[:max_errors] if truncated else error_details,
+                "truncated": truncated
             }
 
         return {
             "valid": True,
-            "errors": []
+            "errors": [],
+            "truncated": False
         }
 
     except json.JSONDecodeError as e:
@@ -60,7 +146,8 @@ def validate_against_schema(schema, data_str):
                 "path": "(parsing)",
                 "message": f"Invalid JSON: {str(e)}",
                 "schema_path": ""
-            }]
+            }],
+            "truncated": False
         }
     except Exception as e:
         return {
@@ -69,7 +156,8 @@ def validate_against_schema(schema, data_str):
                 "path": "(unknown)",
                 "message": f"Validation error: {str(e)}",
                 "schema_path": ""
-            }]
+            }],
+            "truncated": False
         }
 
 
@@ -125,20 +213,24 @@ class SchemaValidationToolFactory:
             }
         }
 
+        # Compile the validators once, every call of the tool reuses them
+        schema_key = _schema_key(parsed_schema)
+        validator = _compiled_validator(schema_key)
+        fast_validate = _compiled_fast_validator(schema_key)
+
         # Create validation function
         def validation_function(data):
             # Perform validation
-            result = validate_against_schema(parsed_schema, data)
+            result = _validate_data(validator, fast_validate, data, MAX_REPORTED_ERRORS)
 
             # Format the response
             if result["valid"]:
                 return "Validation succeeded! The data conforms to the schema."
             else:
-                error_message = "Validation failed! The following errors were found:\n\n"
-                for i, error in enumerate(result["errors"], 1):
-                    error_message += f"{i}. At path '{error['path']}': {error['message']}\n"
-
-                return error_message
+                shown = f" (showing the first {MAX_REPORTED_ERRORS})" if result["truncated"] else ""
+                return f"Validation failed! The following errors were found{shown}:\n\n" + "".join(
+                    f"{i}. At path '{error['path']}': {error['message']}\n"
+                    for i, error in enumerate(result["errors"], 1))
 
         return tool_description, validation_function
 
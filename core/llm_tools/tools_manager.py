@@ -1,9 +1,20 @@
-import copy
-import json
+import threading
 from typing import List, Optional
 
+from core import json_utils
 from core.llm_tools import python_tool, web_fetch_tool, think_tool, schema_validation_tool
 
+NO_ACCESS_DESCRIPTION = "Currently you don't have access to this tool."
+
+
+def _with_description(tool_desc, description):
+    """
+    Copy of a tool description with another description text.
+    Only the outer dicts are copied, the parameters are shared.
+    Tool descriptions (and these copies, which are cached) are read-only, never modify them.
+    """
+    return {**tool_desc, 'function': {**tool_desc['function'], 'description': description}}
+
 
 class ToolsManager:
     """Manager for LLM tools"""
@@ -20,6 +31,8 @@ class ToolsManager:
             schema_validation_limit (int): Maximum number of validation retry attempts
         """
         self.tools = {}
+        # Concurrent requests (e.g. segments of one file) share a ToolsManager and run tools in threads
+        self.usage_lock = threading.Lock()
         self.tools[python_tool.tool_desc['function']['name']] = {
             'desc': python_tool.tool_desc,
             'usage_limit': python_limit,
@@ -53,6 +66,11 @@ class ToolsManager:
                 'init_limit': schema_validation_limit,
             }
 
+        # The descriptions shown to the LLM only depend on the calls left, build each of them once
+        for tool in self.tools.values():
+            tool['no_access_desc'] = _with_description(tool['desc'], NO_ACCESS_DESCRIPTION)
+            tool['limit_descs'] = {}
+
         """
             format: {
                 "tool_name": {
@@ -60,6 +78,8 @@ class ToolsManager:
                     "usage_limit": 1,
                     "func": callable,
                     "init_limit": 3,
+                    "no_access_desc": tool_desc,
+                    "limit_descs": {calls_left: tool_desc},
                 }
             }
         """
@@ -88,15 +108,15 @@ class ToolsManager:
             if tool['usage_limit'] > 0:
                 desc = tool['desc']
                 if add_limits_prompt:
-                    desc = copy.deepcopy(tool['desc'])
-                    desc['function']['description'] += f"\n\nYou have {tool['usage_limit']} " \
-                                                       f"calls to this tool left."
+                    desc = tool['limit_descs'].get(tool['usage_limit'])
+                    if desc is None:
+                        desc = _with_description(tool['desc'], f"{tool['desc']['function']['description']}\n\n"
+                                                               f"You have {tool['usage_limit']} calls to this tool left.")
+                        tool['limit_descs'][tool['usage_limit']] = desc
                 res.append(desc)
             else:
                 # If the LLM has seen the tool, it has to be provided throughout the conversation.
-                desc = copy.deepcopy(tool['desc'])
-                desc['function']['description'] = f"Currently you don't have access to this tool."
-                res.append(desc)
+                res.append(tool['no_access_desc'])
 
         return res
 
@@ -110,11 +130,17 @@ class ToolsManager:
         func = tool_call['function']
         tool_exec_result = ""
         tool_name = func['name']
-        if tool_name in self.tools:
-            if self.tools[tool_name]['usage_limit'] > 0:
-                self.tools[tool_name]['usage_limit'] -= 1
-                argument = json.loads(func['arguments'])
-                tool_exec_result = self.tools[tool_name]['func'](**argument)
+        tool = self.tools.get(tool_name)
+        if tool is not None:
+            with self.usage_lock:
+                allowed = tool['usage_limit'] > 0
+                if allowed:
+                    tool['usage_limit'] -= 1
+            if allowed:
+                argument = func['arguments']
+                if isinstance(argument, (str, bytes)):  # some providers already send a parsed dict
+                    argument = json_utils.loads(argument)
+                tool_exec_result = tool['func'](**argument)
             else:
                 tool_exec_result = f"Error: call {tool_name} exceeded."
         else:
@@ -1,6 +1,20 @@
+import atexit
 import json.decoder
+import threading
 
 import httpx
+from core import json_utils
+
+try:
+    import h2  # noqa: F401, optional, enables HTTP/2 of the fetch client
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+MAX_RESPONSE_BYTES = 10 * 1024  # the tool only returns the first 10KB of a response
+FETCH_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+_fetch_client = None
+_fetch_client_lock = threading.Lock()
 
 tool_desc = {
     "type": "function",
@@ -33,6 +47,38 @@ tool_desc = {
 }
 
 
+def get_fetch_client() -> httpx.Client:
+    """The client of web_fetch, keeps the connections alive between the calls of the tool"""
+    global _fetch_client
+    with _fetch_client_lock:
+        if _fetch_client is None or _fetch_client.is_closed:
+            _fetch_client = httpx.Client(http2=HTTP2_AVAILABLE, timeout=FETCH_TIMEOUT,
+                                         limits=httpx.Limits(max_keepalive_connections=20, max_connections=50))
+        return _fetch_client
+
+
+@atexit.register
+def close_fetch_client():
+    global _fetch_client
+    with _fetch_client_lock:
+        if _fetch_client is not None:
+            _fetch_client.close()
+            _fetch_client = None
+
+
+def read_head(response: httpx.Response, max_bytes=MAX_RESPONSE_BYTES) -> str:
+    """Read at most max_bytes of a streamed response as text, the rest of the body is never downloaded"""
+    content = bytearray()
+    for chunk in response.iter_bytes(chunk_size=4096):
+        content += chunk
+        if len(content) > max_bytes:
+            break
+    text = bytes(content[:max_bytes]).decode(response.encoding or "utf-8", errors="replace")
+    if len(content) > max_bytes:
+        text += "\n...(truncated, only the first 10KB is shown)"
+    return text
+
+
 def web_fetch(url: str, method: str, body: str = None) -> str:
     """
     Fetch the internet
@@ -40,16 +86,16 @@ def web_fetch(url: str, method: str, body: str = None) -> str:
 
     method = method.strip().upper()
     if method == "GET":
-        request = httpx.get(url)
-        return f"Status Code: {request.status_code}\nResponse: {request.text}"
+        with get_fetch_client().stream("GET", url) as request:
+            return f"Status Code: {request.status_code}\nResponse: {read_head(request)}"
 
     if method == "POST":
         try:
-            request = httpx.post(url, json=body)
-            return f"Status Code: {request.status_code}\nResponse: {request.text}"
+            # body is a JSON string, decode it so that it is not sent as one JSON encoded string
+            payload = json_utils.loads(body) if body else None
         except json.decoder.JSONDecodeError as e:
             return f"Error: body JSON invalid: {e}"
+        with get_fetch_client().stream("POST", url, json=payload) as request:
+            return f"Status Code: {request.status_code}\nResponse: {read_head(request)}"
 
     return f"Error: method invalid, use GET or POST"
-
-
@@ -1,16 +1,47 @@
 """
 Data Extraction Tab - Import files and extract data
 """
-from pathlib import Path
-
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
                                QLabel, QPushButton, QLineEdit, QRadioButton,
                                QProgressBar, QTextEdit, QFileDialog, QMessageBox,
                                QButtonGroup, QCheckBox)
 from PySide6.QtCore import Qt, QThread, Signal
 import os
+from typing import List
 from core.extraction_thread import ExtractionThread
 
+SUPPORTED_EXTENSIONS = frozenset(('txt', 'pdf', 'jpg', 'jpeg', 'png'))
+SUPPORTED_SUFFIXES = tuple(f".{ext}" for ext in sorted(SUPPORTED_EXTENSIONS))  # for str.endswith
+LOG_MAX_LINES = 5000
+
+
+def list_supported_files(folder) -> List[str]:
+    """Absolute paths of the supported files in a folder (not recursive)"""
+    folder = os.path.abspath(folder)
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # is_file uses the file type cached by scandir, so each entry is not stat'ed again
+            if entry.name.lower().endswith(SUPPORTED_SUFFIXES) and entry.is_file():
+                files.append(entry.path)
+    return files
+
+
+class FolderScanThread(QThread):
+    """Thread to list the input folder without blocking the UI"""
+    scanned = Signal(list)
+
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+
+    def run(self):
+        try:
+            files = list_supported_files(self.folder)
+        except OSError:
+            files = []
+        self.scanned.emit(files)
+
 
 class DataExtractionTab(QWidget):
     """Tab for importing files and extracting data"""
@@ -22,6 +53,8 @@ class DataExtractionTab(QWidget):
         self.schema_tab = None
         self.method_tab = None
         self.extraction_thread = None
+        self.scan_thread = None
+        self.files_to_process = []
         self.init_ui()
 
     def set_model_tab(self, model_tab):
@@ -103,7 +136,10 @@ class DataExtractionTab(QWidget):
         # Log output
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setUndoRedoEnabled(False)  # appended log lines never need to be undone
         self.log_text.setMaximumHeight(150)
+        # Drop the oldest lines of long runs instead of keeping (and reflowing) all of them
+        self.log_text.document().setMaximumBlockCount(LOG_MAX_LINES)
         progress_layout.addWidget(QLabel("Log:"))
         progress_layout.addWidget(self.log_text)
 
@@ -137,16 +173,16 @@ class DataExtractionTab(QWidget):
             self.update_files_to_extract(folder)
 
     def update_files_to_extract(self, folder):
-        """Update the files to extract"""
-        supported_extensions = ['.txt', '.pdf', '.jpg', '.jpeg', '.png']
-        files = []
-        for filename in os.listdir(folder):
-            full_path = Path(folder) / filename
-            if full_path.is_file():
-                ext = os.path.splitext(full_path)[1].lower()
-                if ext in supported_extensions:
-                    files.append(str(full_path.absolute()))
-
+        """Update the files to extract, the folder is scanned in the background"""
+        self.browse_btn.setEnabled(False)
+        self.file_count_label.setText("Scanning folder...")
+        self.scan_thread = FolderScanThread(folder)
+        self.scan_thread.scanned.connect(self.files_scanned)
+        self.scan_thread.start()
+
+    def files_scanned(self, files):
+        """Handle the result of the folder scan"""
+        self.browse_btn.setEnabled(True)
         self.file_count_label.setText(f"Found {len(files)} supported files")
         self.files_to_process = files
 
@@ -171,7 +207,11 @@ class DataExtractionTab(QWidget):
             QMessageBox.warning(self, "No Input", "Please select an input folder.")
             return
 
-        if not hasattr(self, 'files_to_process') or not self.files_to_process:
+        if self.scan_thread and self.scan_thread.isRunning():
+            QMessageBox.warning(self, "Scanning", "The input folder is still being scanned, please wait.")
+            return
+
+        if not self.files_to_process:
             QMessageBox.warning(self, "No Files", "No supported files found in the selected folder.")
             return
 
@@ -211,13 +251,14 @@ class DataExtractionTab(QWidget):
         self.add_log("Starting extraction process...")
 
         self.extraction_thread = ExtractionThread(
-            model_config=self.model_tab.get_config(),
-            schema_config=self.schema_tab.get_config(),
+            model_config=model_config,
+            schema_config=schema_config,
             method_config=self.method_tab.get_config(),
             extraction_config=self.get_config(),
         )
 
         self.extraction_thread.progress.connect(self.update_progress)
+        self.extraction_thread.progress_pct.connect(self.progress_bar.setValue)
         self.extraction_thread.log.connect(self.add_log)
         self.extraction_thread.ext_finished.connect(self.extraction_finished)
         self.extraction_thread.error.connect(self.extraction_error)
@@ -231,10 +272,10 @@ class DataExtractionTab(QWidget):
             self.add_log("Stopping extraction...")
 
     def update_progress(self, current, total):
-        """Update progress bar"""
-        percentage = int((current / total) * 100) if total > 0 else 0
-        self.progress_bar.setValue(percentage)
-        self.status_label.setText(f"Processing file {current} of {total}")
+        """Update the status label, the progress bar is driven by progress_pct"""
+        status = f"Processing file {current} of {total}"
+        if status != self.status_label.text():
+            self.status_label.setText(status)
 
     def add_log(self, message):
         """Add message to log"""
@@ -5,8 +5,29 @@ from typing import Literal
 
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
                                QLabel, QCheckBox, QPushButton, QMessageBox, QButtonGroup, QRadioButton, QLineEdit,
-                               QTextEdit)
+                               QTextEdit, QComboBox)
 from PySide6.QtCore import Signal
+from PySide6.QtGui import QIntValidator
+
+
+# PDF parse modes, indexed by the button id in pdf_mode_group
+PDF_MODES = ("text", "text_with_img", "page_as_img")
+
+DEFAULT_TOOL_PROMPT = "If you need to perform calculations or conversions, " \
+                      "use the execute_python tool. \n" \
+                      "If you want to query the latest news, " \
+                      "query https://feeds.bbci.co.uk/news/world/rss.xml using " \
+                      "the web_fetch tool.\n" \
+                      "Use the schema verification tool if you are unsure, " \
+                      "and think before you answer.\n"
+
+
+def _as_int(x, default=0):
+    """int(x), or default if x is not an integer"""
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return default
 
 
 class MethodSetupTab(QWidget):
@@ -19,15 +40,22 @@ class MethodSetupTab(QWidget):
         self.init_ui()
 
     def set_default_segment_value(self, mode: Literal['img', 'txt']):
-        if mode == 'img':
-            self.seg_max_text_len.setText("")
-            self.seg_max_pages.setText("5")
-            self.seg_overlap.setText("1")
-        else:
-            self.seg_max_text_len.setText("30000")
-            self.seg_max_pages.setText("")
-            self.seg_overlap.setText("1000")
-
+        fields = (self.seg_max_text_len, self.seg_max_pages, self.seg_overlap)
+        values = ("", "5", "1") if mode == 'img' else ("30000", "", "1000")
+        # Set the three fields silently, then report the change once
+        for field, value in zip(fields, values):
+            field.blockSignals(True)
+            field.setText(value)
+            field.blockSignals(False)
+        self.method_changed.emit()
+
+    def pdf_mode_toggled(self, button_id, checked):
+        if checked:
+            self.set_default_segment_value(mode='txt' if PDF_MODES[button_id] == "text" else 'img')
+
+    def tool_prompt_changed(self):
+        self.tool_prompt_text = None
+        self.method_changed.emit()
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -40,26 +68,35 @@ class MethodSetupTab(QWidget):
         self.pdf_mode_group = QButtonGroup(self)
 
         self.pdf_pure_text_extraction = QRadioButton("Pure Text Extraction")
-        self.pdf_pure_text_extraction.toggled.connect(
-            lambda checked: self.set_default_segment_value(mode='txt') if checked else None
-        )
-        self.pdf_mode_group.addButton(self.pdf_pure_text_extraction)
+        self.pdf_mode_group.addButton(self.pdf_pure_text_extraction, PDF_MODES.index("text"))
         pdf_layout.addWidget(self.pdf_pure_text_extraction)
 
         self.pdf_text_with_img = QRadioButton("Text Extraction + Image (Forced Segmentation by Page, *)")
         self.pdf_text_with_img.setChecked(True)
-        self.pdf_text_with_img.toggled.connect(
-            lambda checked: self.set_default_segment_value(mode='img') if checked else None
-        )
-        self.pdf_mode_group.addButton(self.pdf_text_with_img)
+        self.pdf_mode_group.addButton(self.pdf_text_with_img, PDF_MODES.index("text_with_img"))
         pdf_layout.addWidget(self.pdf_text_with_img)
 
         self.pdf_page_as_img = QRadioButton("Page as Image (Forced Segmentation by Page, *)")
-        self.pdf_page_as_img.toggled.connect(
-            lambda checked: self.set_default_segment_value(mode='img') if checked else None
-        )
-        self.pdf_mode_group.addButton(self.pdf_page_as_img)
+        self.pdf_mode_group.addButton(self.pdf_page_as_img, PDF_MODES.index("page_as_img"))
         pdf_layout.addWidget(self.pdf_page_as_img)
+        # One slot for the whole group, it only reacts to the button that becomes checked
+        self.pdf_mode_group.idToggled.connect(self.pdf_mode_toggled)
+
+        # Page rendering options of "Page as Image"
+        row = QHBoxLayout()
+        self.image_dpi = QLineEdit()
+        self.image_dpi.setText("300")
+        row.addWidget(QLabel("Page image DPI: "))
+        row.addWidget(self.image_dpi)
+        self.text_only_dpi = QLineEdit()
+        self.text_only_dpi.setPlaceholderText("Same as page image DPI")
+        row.addWidget(QLabel("DPI of pages without images: "))
+        row.addWidget(self.text_only_dpi)
+        self.image_format = QComboBox()
+        self.image_format.addItems(["jpg", "png", "webp"])
+        row.addWidget(QLabel("Format: "))
+        row.addWidget(self.image_format)
+        pdf_layout.addLayout(row)
 
         pdf_group.setLayout(pdf_layout)
         layout.addWidget(pdf_group)
@@ -97,6 +134,25 @@ class MethodSetupTab(QWidget):
         self.enable_multi.setChecked(False)
         segmentation_layout.addWidget(self.enable_multi)
 
+        # Concurrency Options Group
+        concurrency_group = QGroupBox("Concurrency Options")
+        concurrency_layout = QVBoxLayout()
+
+        row = QHBoxLayout()
+        self.max_concurrent_files = QLineEdit()
+        self.max_concurrent_files.setText("8")
+        row.addWidget(QLabel("Max files processed concurrently: "))
+        row.addWidget(self.max_concurrent_files)
+        self.max_concurrent_segments = QLineEdit()
+        self.max_concurrent_segments.setText("1")
+        row.addWidget(QLabel("Max segments requested concurrently per file (1 to disable, only used with multiple objects per file): "))
+        row.addWidget(self.max_concurrent_segments)
+        row.addStretch()
+        concurrency_layout.addLayout(row)
+
+        concurrency_group.setLayout(concurrency_layout)
+        layout.addWidget(concurrency_group)
+
         # Tool Options Group
         tool_group = QGroupBox("Tool Options")
         tool_layout = QVBoxLayout()
@@ -142,7 +198,7 @@ class MethodSetupTab(QWidget):
         self.enable_schema_validation = QCheckBox("Schema validation Tool")
         self.enable_schema_validation.setChecked(True)
         row.addWidget(self.enable_schema_validation)
-        row.addWidget(QLabel("Max validations per file (does not share with fail-retry):"))
+        row.addWidget(QLabel("Max validations per file (does not share with fail-retry, also caps the fail-retries per segment):"))
         self.max_validation_retries = QLineEdit()
         self.max_validation_retries.setText("10")
         row.addWidget(self.max_validation_retries)
@@ -157,13 +213,10 @@ class MethodSetupTab(QWidget):
 
         col = QVBoxLayout()
         self.tools_prompt_input = QTextEdit()
-        self.tools_prompt_input.setText("If you need to perform calculations or conversions, "
-                                        "use the execute_python tool. \n"
-                                        "If you want to query the latest news, "
-                                        "query https://feeds.bbci.co.uk/news/world/rss.xml using "
-                                        "the web_fetch tool.\n"
-                                        "Use the schema verification tool if you are unsure, "
-                                        "and think before you answer.\n")
+        self.tools_prompt_input.setText(DEFAULT_TOOL_PROMPT)
+        # toPlainText serializes the whole document, keep its result until the text changes
+        self.tool_prompt_text = None
+        self.tools_prompt_input.textChanged.connect(self.tool_prompt_changed)
         col.addWidget(QLabel("Tools prompt:"))
         col.addWidget(self.tools_prompt_input)
         tool_layout.addLayout(col)
@@ -173,52 +226,61 @@ class MethodSetupTab(QWidget):
 
         layout.addStretch()
 
+        # Numeric fields only accept digits, an empty field falls back to its default in get_config
+        int_validator = QIntValidator(0, 10_000_000, self)
+        for field in (self.image_dpi, self.text_only_dpi, self.seg_max_text_len, self.seg_max_pages,
+                      self.seg_overlap, self.max_concurrent_files, self.max_concurrent_segments,
+                      self.tool_python_max_call, self.tool_web_fetch_max_call, self.tool_think_max_call,
+                      self.max_validation_retries):
+            field.setValidator(int_validator)
+
     def get_config(self):
         """Get the current method configuration"""
+        pdf_mode = PDF_MODES[self.pdf_mode_group.checkedId()]
 
-        def as_int(x, default=0):
-            try:
-                return int(x)
-            except ValueError:
-                return default
-
-        if self.pdf_pure_text_extraction.isChecked():
-            pdf_mode = "text"
-        elif self.pdf_text_with_img.isChecked():
-            pdf_mode = "text_with_img"
-        else:
-            pdf_mode = "page_as_img"
+        image_dpi = max(1, _as_int(self.image_dpi.text(), 300))
+        text_only_dpi = _as_int(self.text_only_dpi.text(), 0) or None
+        image_format = self.image_format.currentText()
 
         use_segmentation = self.enable_seg.isChecked()
-        max_text_length = as_int(self.seg_max_text_len.text(), 30000)
-        max_pages_count = as_int(self.seg_max_pages.text(), 1)
-        overlapping_length = as_int(self.seg_overlap.text(), 1000)
+        max_text_length = _as_int(self.seg_max_text_len.text(), 30000)
+        max_pages_count = _as_int(self.seg_max_pages.text(), 1)
+        overlapping_length = _as_int(self.seg_overlap.text(), 1000)
         multi_obj = self.enable_multi.isChecked()
+        max_concurrent_files = max(1, _as_int(self.max_concurrent_files.text(), 8))
+        max_concurrent_segments = max(1, _as_int(self.max_concurrent_segments.text(), 1))
 
         if self.tool_python.isChecked():
-            max_python_call = as_int(self.tool_python_max_call.text(), 10)
+            max_python_call = _as_int(self.tool_python_max_call.text(), 10)
         else:
             max_python_call = 0
 
         if self.tool_web_fetch.isChecked():
-            max_web_fetch_call = as_int(self.tool_web_fetch_max_call.text(), 10)
+            max_web_fetch_call = _as_int(self.tool_web_fetch_max_call.text(), 10)
         else:
             max_web_fetch_call = 0
 
         if self.enable_schema_validation.isChecked():
-            max_validation_retries = as_int(self.max_validation_retries.text(), 10)
+            max_validation_retries = _as_int(self.max_validation_retries.text(), 10)
         else:
             max_validation_retries = 0
 
-        tool_prompt = self.tools_prompt_input.toPlainText()
+        if self.tool_prompt_text is None:
+            self.tool_prompt_text = self.tools_prompt_input.toPlainText()
+        tool_prompt = self.tool_prompt_text
 
         config = {
             "pdf_mode": pdf_mode,
+            "image_dpi": image_dpi,
+            "text_only_dpi": text_only_dpi,
+            "image_format": image_format,
             "use_segmentation": use_segmentation,
             "max_text_length": max_text_length,
             "max_pages_count": max_pages_count,
             "overlapping_length": overlapping_length,
             "multi_obj": multi_obj,
+            "max_concurrent_files": max_concurrent_files,
+            "max_concurrent_segments": max_concurrent_segments,
             "max_python_call": max_python_call,
             "max_web_fetch_call": max_web_fetch_call,
             "max_validation_retries": max_validation_retries,
@@ -1,13 +1,47 @@
 """
 Model Setup Tab - Configure LLM model and parameters
 """
+from types import MappingProxyType
+
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
                                QLabel, QComboBox, QLineEdit, QPushButton,
                                QDoubleSpinBox, QSpinBox, QTextEdit, QCheckBox,
                                QFormLayout, QMessageBox)
-from PySide6.QtCore import Signal
-from core.llm_client import LLMClient
-import json
+from PySide6.QtCore import Signal, QThread
+from core import json_utils
+from core.llm_client import LLMClient, DEFAULT_RETRY_POLICY
+
+BASE_HEADERS = MappingProxyType({"Content-Type": "application/json"})
+
+
+class ConnectionTestThread(QThread):
+    """Thread to send the test request without blocking the UI"""
+    succeeded = Signal(str)  # response
+    failed = Signal(str)  # error message
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def run(self):
+        try:
+            config = self.config
+            client = LLMClient(
+                endpoint=config['endpoint'],
+                model_name=config['model'],
+                headers=config['headers'],
+                temperature=config['temperature'],
+                max_tokens=config['max_tokens'],
+                top_p=config['top_p'],
+                timeout=config['timeout'],
+                retry_policy=config['retry_policy'],
+            )
+            client.add_text_message("system", "You are a helpful assistant.")
+            client.add_text_message("user", "Say Hello World and nothing else.")
+            resp = client.send_llm_request_once(return_full=False)
+            self.succeeded.emit(str(resp))
+        except Exception as e:
+            self.failed.emit(str(e))
 
 
 class ModelSetupTab(QWidget):
@@ -15,7 +49,7 @@ class ModelSetupTab(QWidget):
 
     model_changed = Signal()
 
-    # Preset configurations
+    # Preset configurations, read-only as they are shared by every instance
     PRESETS = {
         "Grok": {
             "endpoint": "https://api.x.ai/v1/chat/completions",
@@ -43,9 +77,13 @@ class ModelSetupTab(QWidget):
             "headers": {"Content-Type": "application/json"}
         }
     }
+    PRESETS = MappingProxyType({name: MappingProxyType(preset) for name, preset in PRESETS.items()})
 
     def __init__(self):
         super().__init__()
+        self.custom_headers_text = None
+        self.custom_headers = {}
+        self.test_thread = None
         self.init_ui()
 
     def init_ui(self):
@@ -137,6 +175,17 @@ class ModelSetupTab(QWidget):
         timeout_row.addWidget(self.timeout_spin, 1)
         params_layout.addRow(timeout_row)
 
+        # Network Retries
+        retries_row = QHBoxLayout()
+        retries_row.addWidget(QLabel("Max Network Attempts: "))
+        self.max_attempts_spin = QSpinBox()
+        self.max_attempts_spin.setRange(1, 20)
+        self.max_attempts_spin.setValue(DEFAULT_RETRY_POLICY['max_attempts'])
+        self.max_attempts_spin.setToolTip("Requests failing with rate limits (429), server or network errors "
+                                          "are retried with exponential backoff")
+        retries_row.addWidget(self.max_attempts_spin, 1)
+        params_layout.addRow(retries_row)
+
         params_group.setLayout(params_layout)
         layout.addWidget(params_group)
 
@@ -155,8 +204,8 @@ class ModelSetupTab(QWidget):
 
     def on_preset_changed(self, preset_name):
         """Update fields when preset is changed"""
-        if preset_name in self.PRESETS:
-            preset = self.PRESETS[preset_name]
+        preset = self.PRESETS.get(preset_name)
+        if preset is not None:
             self.endpoint_input.setText(preset["endpoint"])
             self.model_input.setText(preset["model"])
 
@@ -168,25 +217,21 @@ class ModelSetupTab(QWidget):
             self.model_changed.emit()
 
     def test_connection(self):
-        """Test the API connection"""
-        try:
-            config = self.get_config()
-            client = LLMClient(
-                endpoint=config['endpoint'],
-                model_name=config['model'],
-                headers=config['headers'],
-                temperature=config['temperature'],
-                max_tokens=config['max_tokens'],
-                top_p=config['top_p'],
-                timeout=config['timeout'],
-            )
-            client.add_text_message("system", "You are a helpful assistant.")
-            client.add_text_message("user", "Say Hello World and nothing else.")
-            resp = client.send_llm_request_once(return_full=False)
-            QMessageBox.information(self, "Test Connection",
-                                    f"Successful: Response with Hello World Request: {resp}")
-        except Exception as e:
-            QMessageBox.warning(self, "Test Connection", f"Failure: {e}")
+        """Test the API connection, the request runs in a background thread"""
+        self.test_btn.setEnabled(False)
+        self.test_thread = ConnectionTestThread(self.get_config())
+        self.test_thread.succeeded.connect(self.connection_test_succeeded)
+        self.test_thread.failed.connect(self.connection_test_failed)
+        self.test_thread.start()
+
+    def connection_test_succeeded(self, resp):
+        self.test_btn.setEnabled(True)
+        QMessageBox.information(self, "Test Connection",
+                                f"Successful: Response with Hello World Request: {resp}")
+
+    def connection_test_failed(self, error_msg):
+        self.test_btn.setEnabled(True)
+        QMessageBox.warning(self, "Test Connection", f"Failure: {error_msg}")
 
     def load_model_from_dict(self, model_param: dict):
         self.preset_combo.setCurrentText("Custom")
@@ -195,20 +240,28 @@ class ModelSetupTab(QWidget):
         self.api_key_input.setText(model_param.get("api_key", ""))
         self.headers_input.setText(model_param.get("headers", ""))
 
+    def parse_custom_headers(self, text: str) -> dict:
+        """Parse the custom headers JSON, the last parsed text is kept as it rarely changes"""
+        if text != self.custom_headers_text:
+            try:
+                parsed = json_utils.loads(text) if text else {}
+            except ValueError:
+                parsed = {}
+            self.custom_headers_text = text
+            self.custom_headers = parsed if isinstance(parsed, dict) else {}
+        return self.custom_headers
+
     def get_config(self):
         """Get the current model configuration"""
 
-        # Parse custom headers
-        try:
-            custom_headers = json.loads(self.headers_input.toPlainText() or "{}")
-        except:
-            custom_headers = {}
+        custom_headers = self.parse_custom_headers(self.headers_input.toPlainText())
 
-        # Build headers
-        headers = {"Content-Type": "application/json"}
-        if self.api_key_input.text():
-            headers["Authorization"] = f"Bearer {self.api_key_input.text().strip()}"
-        headers.update(custom_headers)
+        # Build headers, the custom headers override the defaults and the API key
+        api_key = self.api_key_input.text().strip()
+        if api_key:
+            headers = {**BASE_HEADERS, "Authorization": f"Bearer {api_key}", **custom_headers}
+        else:
+            headers = {**BASE_HEADERS, **custom_headers}
 
         config = {
             "endpoint": self.endpoint_input.text(),
@@ -218,6 +271,7 @@ class ModelSetupTab(QWidget):
             "max_tokens": None,
             "top_p": None,
             "timeout": self.timeout_spin.value(),
+            "retry_policy": {**DEFAULT_RETRY_POLICY, "max_attempts": self.max_attempts_spin.value()},
         }
         if not self.temperature_use_default.isChecked():
             config["temperature"] = self.temperature_spin.value()
@@ -6,13 +6,264 @@ from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
                                QLabel, QComboBox, QLineEdit, QPushButton,
                                QTextEdit, QTreeWidget, QTreeWidgetItem,
                                QFormLayout, QMessageBox, QHeaderView, QFileDialog,
-                               QCheckBox, QSpinBox)
-from PySide6.QtCore import Signal, Qt
+                               QCheckBox, QSpinBox, QApplication)
+from PySide6.QtCore import Signal, Qt, QThread, QTimer
+import functools
 import json
-
+import os
+import re
+import time
+from typing import List
+from jsonschema import Draft7Validator
+from jsonschema.validators import validator_for
+from jsonschema.exceptions import SchemaError
+
+from core import json_utils
 from core.file_manager import FileManager
 from core.llm_client import LLMClient, parse_code_fences
 from core.llm_prompt import gen_schema_system_prompt
+from core.llm_tools.schema_validation_tool import warm_validator_cache
+
+SCHEMA_CHANGED_DEBOUNCE_MS = 200
+SCHEMA_GEN_CACHE_TTL = 24 * 3600  # seconds a generated schema is reused for the same request
+# Any JSON string is a valid property name (spaces, non-ASCII...), only invisible control characters are refused
+INVALID_FIELD_NAME_RE = re.compile(r'[\x00-\x1f\x7f]')
+VALID_TYPES = frozenset(("object", "array", "string", "number", "integer", "boolean", "null"))
+
+SCHEMA_PLACEHOLDER = "Generate the schema or input your schema manually."
+
+# Example invoice schema of "Load Example", serialized once
+_EXAMPLE_SCHEMA = {
+    "title": "Invoice Details",
+    "description": "Schema to hold structured data extracted from an invoice.",
+    "type": "object",
+    "properties": {
+        "invoice_id": {
+            "type": "string",
+            "description": "The unique identifier for the invoice, often prefixed (e.g., 'IN-')."
+        },
+        "issue_date": {
+            "type": "string",
+            "format": "date",
+            "description": "The date the invoice was issued, in YYYY-MM-DD format."
+        },
+        "customer_name": {
+            "type": "string",
+            "description": "The name of the company or individual being billed."
+        },
+        "line_items": {
+            "type": "array",
+            "description": "A list of all items or services being billed on the invoice.",
+            "items": {
+                "type": "object",
+                "description": "A single billable item or service.",
+                "properties": {
+                    "item_description": {
+                        "type": "string",
+                        "description": "The name or description of the product or service."
+                    },
+                    "quantity": {
+                        "type": "integer",
+                        "description": "The number of units of the item."
+                    },
+                    "unit_price": {
+                        "type": "number",
+                        "description": "The cost for a single unit of the item."
+                    }
+                },
+                "required": ["item_description", "quantity", "unit_price"]
+            }
+        },
+        "total_amount": {
+            "type": "number",
+            "description": "The final total amount due for the invoice."
+        }
+    },
+    "required": [
+        "invoice_id",
+        "issue_date",
+        "customer_name",
+        "line_items",
+        "total_amount"
+    ]
+}
+EXAMPLE_SCHEMA_JSON = json_utils.dumps(_EXAMPLE_SCHEMA, indent=True).decode('utf-8')
+
+
+def _reject_duplicate_keys(pairs):
+    """A hook for json.loads to fail on duplicate keys."""
+    result = dict(pairs)  # built in C, a duplicate key makes it shorter than pairs
+    if len(result) != len(pairs):
+        # Only an invalid schema pays for finding the key to report
+        keys = set()
+        for key, _ in pairs:
+            if key in keys:
+                raise ValueError(f"Duplicate key found in JSON object: '{key}'")
+            keys.add(key)
+    return result
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_schema(schema_text: str):
+    """
+    Parse a schema once per schema text, for the schemas that do not pass validate_json_schema.
+    The returned dict is shared between callers, it must not be modified.
+    """
+    return json_utils.loads(schema_text)
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled_validator(schema_text: str):
+    """
+    Parse and check a schema once per schema text, returns its validator.
+    Raises ValueError if the schema is invalid (failures are not cached).
+    """
+    try:
+        # Use the hook to parse the JSON. This validates syntax AND checks for duplicates.
+        # Stays on the stdlib json, orjson has no object_pairs_hook.
+        schema = json.loads(schema_text, object_pairs_hook=_reject_duplicate_keys)
+    except json.JSONDecodeError as e:
+        # Catch badly formed JSON
+        raise ValueError(f"Invalid JSON syntax: {e}") from e
+
+    # Additional JSON Schema validation (your original checks)
+    if "properties" in schema and not isinstance(schema.get("properties"), dict):
+        raise ValueError("'properties' must be an object")
+
+    # Check for common JSON Schema fields
+    if schema.get("type") and schema["type"] not in VALID_TYPES:
+        raise ValueError(f"Invalid type: {schema['type']}. Must be one of: {', '.join(sorted(VALID_TYPES))}")
+
+    # Check against the meta-schema, the costly part of building a validator.
+    # Schemas without "$schema" follow Draft 7 like the rest of the app.
+    cls = validator_for(schema, default=Draft7Validator)
+    try:
+        cls.check_schema(schema)
+    except SchemaError as e:
+        raise ValueError(f"Invalid JSON Schema: {e.message}") from e
+
+    # Generate the (fastjsonschema) validators used during extraction now, while the user is
+    # still looking at the schema; they fall back to jsonschema if it cannot be compiled
+    warm_validator_cache(schema)
+    return cls(schema)
+
+
+def schema_to_tree_items(properties, required, to_collapse) -> List[QTreeWidgetItem]:
+    """
+    Build the (detached) tree items of JSON Schema properties.
+    Arrays of primitives (their only child is the item type) are appended to to_collapse,
+    the other items with children are shown expanded.
+    """
+    top_items = None
+    # Walk the nested properties with an explicit stack instead of recursing,
+    # each entry is one level: (properties, required, parent item or None for the top level)
+    stack = [(properties, required, None)]
+    while stack:
+        properties, required, parent_item = stack.pop()
+        required = set(required or ())  # membership is tested once per property of the level
+        items = []
+        for prop_name, prop_def in properties.items():
+            prop_type = prop_def.get("type", "string")
+            prop_desc = prop_def.get("description", "")
+
+            # Create tree item, the columns are Field Name, Type, Required, Description
+            item = QTreeWidgetItem([prop_name, prop_type, "True" if prop_name in required else "False", prop_desc])
+            items.append(item)
+
+            # Handle nested properties
+            if prop_type == "object" and "properties" in prop_def:
+                stack.append((prop_def["properties"], prop_def["required"], item))
+            elif prop_type == "array" and "items" in prop_def:
+                items_def = prop_def["items"]
+                if items_def.get("type") == "object" and "properties" in items_def:
+                    # Array of objects
+                    stack.append((items_def["properties"], items_def["required"], item))
+                else:
+                    # Option 1: Add a child item for the item type
+                    # Required is left empty, it is not directly "required" in the same sense
+                    item.addChild(QTreeWidgetItem(["item", items_def.get("type", "unknown"), "",
+                                                   items_def.get("description", "")]))
+                    to_collapse.append(item)
+
+        # A level is added to its parent in one call
+        if parent_item is None:
+            top_items = items
+        else:
+            parent_item.addChildren(items)
+    return top_items
+
+
+@functools.lru_cache(maxsize=8)  # entries can hold whole base64 images
+def _sample_file_segments(file_path, mtime_ns, size):
+    """
+    Segments of a sample file, parsed once per file version (mtime, size) so that
+    generating again from the same sample file does not parse it again. Do not modify them.
+    """
+    file_manager = FileManager(
+        file_list=[file_path],
+        use_segment=False,
+    )
+    return file_manager.get_segments(file_path)
+
+
+class SchemaGenerationThread(QThread):
+    """Thread to read the sample file and send the schema generation request without blocking the UI"""
+    succeeded = Signal(str)  # LLM response
+    failed = Signal(str)  # error message
+
+    def __init__(self, model_config, file_path, research_question):
+        super().__init__()
+        self.model_config = model_config
+        self.file_path = file_path
+        self.research_question = research_question
+
+    def run(self):
+        model_config = self.model_config
+        file_path = self.file_path
+
+        try:
+            llm_client = LLMClient(
+                endpoint=model_config['endpoint'],
+                model_name=model_config['model'],
+                headers=model_config['headers'],
+                timeout=model_config['timeout'],
+            )
+
+            stat = os.stat(file_path)
+            file_seg = _sample_file_segments(file_path, stat.st_mtime_ns, stat.st_size)[0]
+            if 'text' in file_seg and file_seg['text']:
+                sample_text = file_seg['text']
+            else:
+                sample_text = ""
+
+            # Most stable first, so providers with prompt (prefix) caching can reuse the longest prefix:
+            # the fixed system prompt, then the sample file, the research question changes the most
+            llm_client.add_text_message(
+                "system",
+                gen_schema_system_prompt()
+            )
+
+            llm_client.add_text_message(
+                "user",
+                f"Sample File: {sample_text}"
+            )
+
+            if 'img' in file_seg:
+                for i in file_seg['img']:
+                    llm_client.add_image_message(
+                        role="user",
+                        img_b64=i
+                    )
+
+            llm_client.add_text_message(
+                "user",
+                f"Research question: {self.research_question}"
+            )
+
+            self.succeeded.emit(llm_client.send_llm_request(return_full=False) or "")
+
+        except Exception as e:
+            self.failed.emit(str(e))
 
 
 class SchemaSetupTab(QWidget):
@@ -24,6 +275,10 @@ class SchemaSetupTab(QWidget):
         super().__init__()
         self.init_ui()
         self.model_tab = None
+        self.schema_gen_thread = None
+        self.last_schema_error = None  # (schema text, error message) of the last invalid schema
+        self.schema_gen_key = None
+        self.schema_gen_cache = {}  # {request key: (time, LLM response)}, see schema_gen_request_key
 
     def set_model_tab(self, model_tab):
         """Set reference to model setup tab"""
@@ -75,9 +330,11 @@ class SchemaSetupTab(QWidget):
         file_layout.addWidget(self.browse_btn)
         auto_layout.addLayout(file_layout)
 
-        self.generate_btn = QPushButton("Auto Generate")
-        self.generate_btn.clicked.connect(self.generate_schema_auto)
-        auto_layout.addWidget(self.generate_btn)
+        self.auto_generate_btn = QPushButton("Auto Generate")
+        self.auto_generate_btn.setToolTip("A repeated request reuses the last generated schema, "
+                                          "Shift+Click to generate a new one")
+        self.auto_generate_btn.clicked.connect(self.generate_schema_auto)
+        auto_layout.addWidget(self.auto_generate_btn)
 
         auto_layout.addStretch(1)
 
@@ -91,6 +348,11 @@ class SchemaSetupTab(QWidget):
         title_layout.addWidget(QLabel("Schema Title:"))
         self.json_title_input = QLineEdit()
         self.json_title_input.setPlaceholderText("e.g., Invoice Details")
+        # Raw text of the schema the tree was last loaded from, and the schema text generated from the tree.
+        # Both are reset by any edit of the tree or title, see tree_edited
+        self.tree_loaded_text = None
+        self.tree_schema_text = None
+        self.json_title_input.textChanged.connect(self.tree_edited)
         title_layout.addWidget(self.json_title_input)
         manual_schema_layout.addLayout(title_layout)
 
@@ -182,7 +444,13 @@ class SchemaSetupTab(QWidget):
 
         self.schema_text = QTextEdit()
         self.schema_text.setPlaceholderText(self.get_placeholder_text())
+        self.schema_text_cache = None  # stripped text of schema_text, None after an edit
         self.schema_text.textChanged.connect(self.on_raw_schema_changed)
+        # Edits (raw typing, field edits) only emit schema_changed once, after a pause
+        self.schema_changed_timer = QTimer(self)
+        self.schema_changed_timer.setSingleShot(True)
+        self.schema_changed_timer.setInterval(SCHEMA_CHANGED_DEBOUNCE_MS)
+        self.schema_changed_timer.timeout.connect(self.schema_changed.emit)
         raw_layout.addWidget(self.schema_text)
 
         # Buttons for raw schema
@@ -218,131 +486,67 @@ class SchemaSetupTab(QWidget):
 
     def get_placeholder_text(self):
         """Get placeholder text for schema editor"""
-        return """Generate the schema or input your schema manually."""
+        return SCHEMA_PLACEHOLDER
 
 
     def load_json_to_tree(self):
+        # Loading the schema the tree already shows (and was not edited since) is a no-op
+        schema_text = self.raw_schema_text()
+        if schema_text == self.tree_loaded_text:
+            return
         try:
-            schema = json.loads(self.schema_text.toPlainText())
+            schema = self.parsed_schema(schema_text)
             self.json_title_input.setText(schema.get("title", "Data Schema").strip())
 
-            # Also populate the tree widget with the example
-            self.fields_tree.clear()
-            self.populate_tree_from_schema(schema.get("properties", {}), schema.get("required", []))
+            # Also populate the tree widget with the example. Clearing and refilling are one bulk change:
+            # no repaint in between, and no selection / current item signals for the items dropped
+            self.fields_tree.setUpdatesEnabled(False)
+            self.fields_tree.blockSignals(True)
+            # The tree changes from here on, only a fully successful load records its text
+            self.tree_edited()
+            try:
+                self.fields_tree.clear()
+                self.populate_tree_from_schema(schema.get("properties", {}), schema.get("required", []))
+            finally:
+                self.fields_tree.blockSignals(False)
+                self.fields_tree.setUpdatesEnabled(True)
+            self.tree_loaded_text = schema_text
         except Exception as e:
             QMessageBox.warning(self, "Error Parsing JSON", f"Error when parsing JSON: {e}")
 
+    def tree_edited(self):
+        """The tree or title changed, they no longer match the last loaded or generated schema text"""
+        self.tree_loaded_text = None
+        self.tree_schema_text = None
+
     def load_example_schema(self):
         """Load an example invoice schema"""
-        example = {
-            "title": "Invoice Details",
-            "description": "Schema to hold structured data extracted from an invoice.",
-            "type": "object",
-            "properties": {
-                "invoice_id": {
-                    "type": "string",
-                    "description": "The unique identifier for the invoice, often prefixed (e.g., 'IN-')."
-                },
-                "issue_date": {
-                    "type": "string",
-                    "format": "date",
-                    "description": "The date the invoice was issued, in YYYY-MM-DD format."
-                },
-                "customer_name": {
-                    "type": "string",
-                    "description": "The name of the company or individual being billed."
-                },
-                "line_items": {
-                    "type": "array",
-                    "description": "A list of all items or services being billed on the invoice.",
-                    "items": {
-                        "type": "object",
-                        "description": "A single billable item or service.",
-                        "properties": {
-                            "item_description": {
-                                "type": "string",
-                                "description": "The name or description of the product or service."
-                            },
-                            "quantity": {
-                                "type": "integer",
-                                "description": "The number of units of the item."
-                            },
-                            "unit_price": {
-                                "type": "number",
-                                "description": "The cost for a single unit of the item."
-                            }
-                        },
-                        "required": ["item_description", "quantity", "unit_price"]
-                    }
-                },
-                "total_amount": {
-                    "type": "number",
-                    "description": "The final total amount due for the invoice."
-                }
-            },
-            "required": [
-                "invoice_id",
-                "issue_date",
-                "customer_name",
-                "line_items",
-                "total_amount"
-            ]
-        }
-
-        self.schema_text.setPlainText(json.dumps(example, indent=2))
+        self.schema_text.setPlainText(EXAMPLE_SCHEMA_JSON)
         self.load_json_to_tree()
 
     def populate_tree_from_schema(self, properties, required, parent_item=None):
         """Populate tree widget from JSON Schema properties"""
-        for prop_name, prop_def in properties.items():
-            prop_type = prop_def.get("type", "string")
-            prop_desc = prop_def.get("description", "")
-
-            # Create tree item
-            item = QTreeWidgetItem()
-            item.setText(0, prop_name)
-            item.setText(1, prop_type)
-            if prop_name in required:
-                item.setText(2, "True")
-            else:
-                item.setText(2, "False")
-            item.setText(3, prop_desc)
-
-            # Store data
-            # item.setData(0, Qt.UserRole, {
-            #     "name": prop_name,
-            #     "type": prop_type,
-            #     "description": prop_desc
-            # })
-
+        # Build the items detached from the tree, then insert them in one go with repaints off
+        to_collapse = []
+        items = schema_to_tree_items(properties, required, to_collapse)
+        self.fields_tree.setUpdatesEnabled(False)
+        try:
+            # Items can only be expanded once they are in the tree: expand everything in one call,
+            # then collapse the few items that are shown collapsed
             if parent_item is None:
-                self.fields_tree.addTopLevelItem(item)
+                self.fields_tree.addTopLevelItems(items)
+                self.fields_tree.expandAll()
             else:
-                parent_item.addChild(item)
-
-            # Handle nested properties
-            if prop_type == "object" and "properties" in prop_def:
-                self.populate_tree_from_schema(prop_def["properties"], prop_def["required"], item)
-                item.setExpanded(True)
-            elif prop_type == "array" and "items" in prop_def:
-                items_def = prop_def["items"]
-                if items_def.get("type") == "object" and "properties" in items_def:
-                    # Array of objects
-                    self.populate_tree_from_schema(items_def["properties"], items_def["required"], item)
-                    item.setExpanded(True)
-                else:
-                    # Option 1: Add a child item for the item type
-                    item_type_str = items_def.get("type", "unknown")
-                    child_item = QTreeWidgetItem()
-                    child_item.setText(0, f"item")
-                    child_item.setText(1, item_type_str)
-                    child_item.setText(2, "")  # Not directly "required" in the same sense
-                    child_item.setText(3, items_def.get("description", ""))
-                    item.addChild(child_item)
+                parent_item.addChildren(items)
+                self.fields_tree.expandRecursively(self.fields_tree.indexFromItem(parent_item))
+            for item in to_collapse:
+                item.setExpanded(False)
+        finally:
+            self.fields_tree.setUpdatesEnabled(True)
 
     def validate_schema(self):
         """Validate the schema"""
-        schema_text = self.schema_text.toPlainText().strip()
+        schema_text = self.raw_schema_text()
 
         if not schema_text:
             QMessageBox.warning(self, "Empty Schema", "Please enter a schema first.")
@@ -357,37 +561,36 @@ class SchemaSetupTab(QWidget):
     def validate_json_schema(self, schema_text: str):
         """
         Validate JSON syntax and schema structure, disallowing duplicate keys.
+        The validator is cached per schema text, and so is the error of the last invalid schema:
+        validating an unchanged schema again is free.
         """
-        def _reject_duplicate_keys(pairs):
-            """A hook for json.loads to fail on duplicate keys."""
-            keys = set()
-            result = {}
-            for key, value in pairs:
-                if key in keys:
-                    raise ValueError(f"Duplicate key found in JSON object: '{key}'")
-                keys.add(key)
-                result[key] = value
-            return result
-
+        if self.last_schema_error is not None and self.last_schema_error[0] == schema_text:
+            # A new exception each time, raising the stored one again would grow its traceback
+            raise ValueError(self.last_schema_error[1])
         try:
-            # Use the hook to parse the JSON. This validates syntax AND checks for duplicates.
-            schema = json.loads(schema_text, object_pairs_hook=_reject_duplicate_keys)
-        except json.JSONDecodeError as e:
-            # Catch badly formed JSON
-            raise ValueError(f"Invalid JSON syntax: {e}") from e
-        except ValueError as e:
-            # Catch duplicate keys or other ValueErrors from the hook
-            raise e
+            return _compiled_validator(schema_text)
+        except Exception as e:
+            self.last_schema_error = (schema_text, str(e))
+            raise
 
-        # Additional JSON Schema validation (your original checks)
-        if "properties" in schema and not isinstance(schema.get("properties"), dict):
-            raise ValueError("'properties' must be an object")
 
-        # Check for common JSON Schema fields
-        valid_types = {"object", "array", "string", "number", "integer", "boolean", "null"}
-        if schema.get("type") and schema["type"] not in valid_types:
-            raise ValueError(f"Invalid type: {schema['type']}. Must be one of {valid_types}")
+    def parsed_schema(self, schema_text: str):
+        """
+        The parsed schema of a text, shared by validation, get_config and the tree loader:
+        the schema of the cached validator when it is valid, a plain (cached) parse otherwise.
+        Raises ValueError if the text is not JSON. The returned dict must not be modified.
+        """
+        try:
+            return self.validate_json_schema(schema_text).schema
+        except Exception:
+            return _parse_schema(schema_text)
 
+    def sibling_names(self, parent_item):
+        """Names of the fields under parent_item (None for the root level), read in one pass"""
+        if parent_item is None:
+            tree = self.fields_tree
+            return {tree.topLevelItem(i).text(0) for i in range(tree.topLevelItemCount())}
+        return {parent_item.child(i).text(0) for i in range(parent_item.childCount())}
 
     def add_field(self, parent_item):
         """Add a field to the schema tree"""
@@ -398,13 +601,12 @@ class SchemaSetupTab(QWidget):
         if not name:
             QMessageBox.warning(self, "Invalid Input", "Field name cannot be empty.")
             return
+        if INVALID_FIELD_NAME_RE.search(name):
+            QMessageBox.warning(self, "Invalid Input", "Field name cannot contain control characters.")
+            return
 
-        # Create tree item
-        item = QTreeWidgetItem()
-        item.setText(0, name)
-        item.setText(1, field_type)
-        item.setText(2, required)
-        item.setText(3, description)
+        # Create tree item, all columns are set by the constructor
+        item = QTreeWidgetItem([name, field_type, required, description])
 
         # Store additional data
         # item.setData(0, Qt.UserRole, {
@@ -413,23 +615,16 @@ class SchemaSetupTab(QWidget):
         #     "description": description
         # })
 
+        if name in self.sibling_names(parent_item):
+            where = "root" if parent_item is None else parent_item.text(0)
+            QMessageBox.warning(self, "Invalid Input", f"{name} already exists in {where}!")
+            return
+
         if parent_item is None:
             # Add as root item
-            for i in range(self.fields_tree.topLevelItemCount()):
-                hist_item = self.fields_tree.topLevelItem(i)
-                field_name = hist_item.text(0)
-                if name == field_name:
-                    QMessageBox.warning(self, "Invalid Input", f"{name} already exists in root!")
-                    return
             self.fields_tree.addTopLevelItem(item)
         else:
             # Add as child
-            for i in range(parent_item.childCount()):
-                hist_item = parent_item.child(i)
-                field_name = hist_item.text(0)
-                if name == field_name:
-                    QMessageBox.warning(self, "Invalid Input", f"{name} already exists in  {parent_item.text(0)}!")
-                    return
             parent_item.addChild(item)
             parent_item.setExpanded(True)
 
@@ -437,7 +632,8 @@ class SchemaSetupTab(QWidget):
         self.field_name_input.clear()
         self.field_desc_input.clear()
 
-        self.schema_changed.emit()
+        self.tree_edited()
+        self.schema_changed_timer.start()
 
     def on_tree_item_clicked(self, item, column):
         """Load selected tree item into the editor fields"""
@@ -463,25 +659,19 @@ class SchemaSetupTab(QWidget):
         if not name:
             QMessageBox.warning(self, "Invalid Input", "Field name cannot be empty.")
             return
+        if INVALID_FIELD_NAME_RE.search(name):
+            QMessageBox.warning(self, "Invalid Input", "Field name cannot contain control characters.")
+            return
 
         # Check if name changed and if new name conflicts with siblings
         old_name = item.text(0)
+        # A sibling with the new name can not be the item itself, which still has the old name
         if name != old_name:
             parent = item.parent()
-            if parent is None:
-                # Check root level siblings
-                for i in range(self.fields_tree.topLevelItemCount()):
-                    sibling = self.fields_tree.topLevelItem(i)
-                    if sibling != item and sibling.text(0) == name:
-                        QMessageBox.warning(self, "Invalid Input", f"{name} already exists in root!")
-                        return
-            else:
-                # Check siblings under same parent
-                for i in range(parent.childCount()):
-                    sibling = parent.child(i)
-                    if sibling != item and sibling.text(0) == name:
-                        QMessageBox.warning(self, "Invalid Input", f"{name} already exists in {parent.text(0)}!")
-                        return
+            if name in self.sibling_names(parent):
+                where = "root" if parent is None else parent.text(0)
+                QMessageBox.warning(self, "Invalid Input", f"{name} already exists in {where}!")
+                return
 
         # Update the item
         item.setText(0, name)
@@ -493,7 +683,8 @@ class SchemaSetupTab(QWidget):
         self.field_name_input.clear()
         self.field_desc_input.clear()
 
-        self.schema_changed.emit()
+        self.tree_edited()
+        self.schema_changed_timer.start()
 
     def add_child_field(self):
         """Add a child field to the selected item"""
@@ -531,7 +722,8 @@ class SchemaSetupTab(QWidget):
             # Child item
             parent.removeChild(item)
 
-        self.schema_changed.emit()
+        self.tree_edited()
+        self.schema_changed_timer.start()
 
     # def tree_to_fields_list(self):
     #     """Convert tree structure to flat fields list (for backward compatibility)"""
@@ -552,52 +744,59 @@ class SchemaSetupTab(QWidget):
 
     def tree_item_to_schema(self, item):
         """Convert a tree item to JSON Schema property definition"""
-        name = item.text(0)
-        field_type = item.text(1)
-        required = item.text(2)
-        description = item.text(3)
-
-        property_def = {"type": field_type}
-
-        if description:
-            property_def["description"] = description
-
-        # Handle object type with children
-        if field_type == "object" and item.childCount() > 0:
-            property_def["properties"] = {}
-            property_def["required"] = []
-
-            for i in range(item.childCount()):
-                child = item.child(i)
-                child_name = child.text(0)
-                child_def = self.tree_item_to_schema(child)
-                property_def["properties"][child_name] = child_def
-                if child.text(2) != "False":
-                    property_def["required"].append(child_name)
-
-        # Handle array type with children
-        elif field_type == "array" and item.childCount() > 0:
-            # For arrays, the first child defines the item schema
-            if item.childCount() == 1:
-                first_child = item.child(0)
-                property_def["items"] = self.tree_item_to_schema(first_child)
-                property_def["description"] = description or f"Array of {first_child.text(0)} items"
-            else:
-                # Multiple children - treat as object schema for array items
-                property_def["items"] = {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                }
-                for i in range(item.childCount()):
-                    child = item.child(i)
-                    child_name = child.text(0)
-                    child_def = self.tree_item_to_schema(child)
-                    property_def["items"]["properties"][child_name] = child_def
-                    if child.text(2) != "False":
-                        property_def["items"]["required"].append(child_name)
-
-        return property_def
+        schema = {}
+        # Walk the tree with an explicit stack instead of recursing per item, each entry is
+        # an item and the (still empty) definition dict already placed in its parent's definition
+        stack = [(item, schema)]
+        while stack:
+            item, property_def = stack.pop()
+            field_type = item.text(1)
+            description = item.text(3)
+            children = [item.child(i) for i in range(item.childCount())]
+
+            property_def["type"] = field_type
+
+            if description:
+                property_def["description"] = description
+
+            # Handle object type with children
+            if field_type == "object" and children:
+                property_def["properties"], property_def["required"] = self._child_schemas(children, stack)
+
+            # Handle array type with children
+            elif field_type == "array" and children:
+                # For arrays, the first child defines the item schema
+                if len(children) == 1:
+                    first_child = children[0]
+                    property_def["items"] = items_def = {}
+                    stack.append((first_child, items_def))
+                    property_def["description"] = description or f"Array of {first_child.text(0)} items"
+                else:
+                    # Multiple children - treat as object schema for array items
+                    properties, required = self._child_schemas(children, stack)
+                    property_def["items"] = {
+                        "type": "object",
+                        "properties": properties,
+                        "required": required
+                    }
+
+        return schema
+
+    @staticmethod
+    def _child_schemas(children, stack):
+        """
+        The properties and required list of an object with these child items.
+        The child definitions are left empty and pushed on the stack of tree_item_to_schema.
+        """
+        properties = {}
+        required = []
+        for child in children:
+            child_name = child.text(0)
+            properties[child_name] = child_def = {}
+            stack.append((child, child_def))
+            if child.text(2) != "False":
+                required.append(child_name)
+        return properties, required
 
     def load_tree_to_json(self):
         """Generate schema text from fields tree"""
@@ -605,35 +804,44 @@ class SchemaSetupTab(QWidget):
             QMessageBox.warning(self, "No Fields", "Please add fields first.")
             return
 
-        schema = {
-            "title": self.json_title_input.text().strip() or "Data Schema",
-            "type": "object",
-            "properties": {},
-            "required": []
-        }
+        # The tree is only converted again after it (or the title) was edited
+        if self.tree_schema_text is None:
+            schema = {
+                "title": self.json_title_input.text().strip() or "Data Schema",
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
 
-        # Process each top-level item
-        for i in range(self.fields_tree.topLevelItemCount()):
-            item = self.fields_tree.topLevelItem(i)
-            field_name = item.text(0)
-            property_def = self.tree_item_to_schema(item)
+            # Process each top-level item
+            for i in range(self.fields_tree.topLevelItemCount()):
+                item = self.fields_tree.topLevelItem(i)
+                field_name = item.text(0)
+                property_def = self.tree_item_to_schema(item)
 
-            schema["properties"][field_name] = property_def
-            if item.text(2) != "False":
-                schema["required"].append(field_name)
+                schema["properties"][field_name] = property_def
+                if item.text(2) != "False":
+                    schema["required"].append(field_name)
 
-        schema_text = json.dumps(schema, indent=2, ensure_ascii=False)
+            self.tree_schema_text = json_utils.dumps(schema, indent=True).decode('utf-8')
 
-        self.schema_text.setPlainText(schema_text)
-        self.schema_changed.emit()
+        self.schema_text.setPlainText(self.tree_schema_text)
+        self.schema_changed_timer.start()
 
     def on_raw_schema_changed(self):
-        """Handle manual editing of raw schema"""
-        self.schema_changed.emit()
+        """Handle manual editing of raw schema, schema_changed is emitted after a pause"""
+        self.schema_text_cache = None
+        self.schema_changed_timer.start()
+
+    def raw_schema_text(self):
+        """The stripped raw schema, the document is only converted to a str again after an edit"""
+        if self.schema_text_cache is None:
+            self.schema_text_cache = self.schema_text.toPlainText().strip()
+        return self.schema_text_cache
 
     def get_config(self):
         """Get the schema configuration"""
-        raw_schema = self.schema_text.toPlainText().strip()
+        raw_schema = self.raw_schema_text()
 
         # Get fields from tree structure
         # fields = self.tree_to_fields_list()
@@ -641,7 +849,7 @@ class SchemaSetupTab(QWidget):
         # Parse and include the actual JSON schema object
         if raw_schema:
             try:
-                json_schema = json.loads(raw_schema)
+                json_schema = self.parsed_schema(raw_schema)
             except:
                 json_schema = None
         else:
@@ -669,57 +877,61 @@ class SchemaSetupTab(QWidget):
         if file_path:
             self.file_input.setText(file_path)
 
+    @staticmethod
+    def schema_gen_request_key(model_config, file_path, research_question):
+        """
+        Key of a schema generation request for schema_gen_cache, None if the sample file can not be stat'ed.
+        The sample file is identified by its modification time and size, an edited file is a new request.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (model_config['endpoint'], model_config['model'], research_question,
+                os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
     def generate_schema_auto(self):
+        """Generate the schema with the LLM, the request runs in a background thread"""
         model_config = self.model_tab.get_config()
         file_path = self.file_input.text()
+        research_question = self.research_question_input.toPlainText()
+
+        # The same question on the same sample file reuses the last parsable response, Shift+Click regenerates
+        self.schema_gen_key = self.schema_gen_request_key(model_config, file_path, research_question)
+        cached = self.schema_gen_cache.get(self.schema_gen_key)
+        regenerate = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        if cached is not None and not regenerate and time.monotonic() - cached[0] < SCHEMA_GEN_CACHE_TTL:
+            self.schema_generation_succeeded(cached[1], from_cache=True)
+            return
 
-        try:
-            llm_client = LLMClient(
-                endpoint=model_config['endpoint'],
-                model_name=model_config['model'],
-                headers=model_config['headers'],
-                timeout=model_config['timeout'],
-            )
-
-            file_manager = FileManager(
-                file_list=[file_path],
-                use_segment=False,
-            )
-
-            file_seg = file_manager.get_segments(file_path)[0]
-            if 'text' in file_seg and file_seg['text']:
-                sample_text = file_seg['text']
+        self.auto_generate_btn.setEnabled(False)
+        self.schema_gen_thread = SchemaGenerationThread(
+            model_config=model_config,
+            file_path=file_path,
+            research_question=research_question,
+        )
+        self.schema_gen_thread.succeeded.connect(self.schema_generation_succeeded)
+        self.schema_gen_thread.failed.connect(self.schema_generation_failed)
+        self.schema_gen_thread.start()
+
+    def schema_generation_succeeded(self, llm_resp, from_cache=False):
+        self.auto_generate_btn.setEnabled(True)
+        parsed = parse_code_fences(llm_resp)
+        if parsed:
+            if self.schema_gen_key is not None and not from_cache:
+                self.schema_gen_cache[self.schema_gen_key] = (time.monotonic(), llm_resp)
+            self.schema_text.setPlainText(parsed[0])
+            if from_cache:
+                QMessageBox.information(self, "Complete", "Loaded the schema generated before for the same "
+                                                          "request, Shift+Click Auto Generate to generate a new "
+                                                          "one. Loading tree...")
             else:
-                sample_text = ""
-
-            llm_client.add_text_message(
-                "system",
-                gen_schema_system_prompt()
-            )
-
-            llm_client.add_text_message(
-                "user",
-                f"Research question: {self.research_question_input.toPlainText()}\n\n"
-                f"Sample File: {sample_text}"
-            )
-
-            if 'img' in file_seg:
-                for i in file_seg['img']:
-                    llm_client.add_image_message(
-                        role="user",
-                        img_b64=i
-                    )
-
-            llm_resp = llm_client.send_llm_request(return_full=False)
-            parsed = parse_code_fences(llm_resp)
-            if parsed:
-                self.schema_text.setPlainText(parsed[0])
                 QMessageBox.information(self, "Complete", f"Automatic generation of schema complete, loading tree...")
-                self.load_json_to_tree()
-            else:
-                print(f"Cannot parse {llm_resp}")
-                QMessageBox.warning(self, "Failed", f"Can't parse the LLM result, please try again.")
-
-        except Exception as e:
-            QMessageBox.warning(self, "Failed", f"Error loading LLM, check LLM configuration. \nError: {e}")
+            self.load_json_to_tree()
+        else:
+            print(f"Cannot parse {llm_resp}")
+            QMessageBox.warning(self, "Failed", f"Can't parse the LLM result, please try again.")
 
+    def schema_generation_failed(self, error_msg):
+        self.auto_generate_btn.setEnabled(True)
+        QMessageBox.warning(self, "Failed", f"Error loading LLM, check LLM configuration. \nError: {error_msg}")